@@ -17,9 +17,6 @@ done
 # Prints the full path of the current directory.
 DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )
 
-# Create a temporary Python file to process the generated tainted operations.
-cat $DIR/visualize/head.py $1 $DIR/visualize/tail.py > /tmp/visualize.py
-
 if [ "$2" == "true" ]; then
         metadata="--metadata"
 else
@@ -51,4 +48,6 @@ else
 	debug=""
 fi
 
-python /tmp/visualize.py $metadata $graph $enum $verbose $debug
+# Interpret the tainted operations line by line with the classes in head.py.
+python $DIR/visualize/interpret.py $DIR/visualize/head.py $1 $DIR/visualize/tail.py -- \
+	$metadata $graph $enum $verbose $debug
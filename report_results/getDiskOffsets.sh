@@ -2,6 +2,10 @@
 #	script to process unique ICMP instructions with disk comparisions (all disk structure comparisions in a filesystem workflow).
 #	lists all blocks and their offsets in use.
 
+# traceServer.py keeps the trace index loaded between queries
+DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )
+QUERY="python $DIR/../visualize/post_processing/traceQuery.py --trace /tmp/testfs.py"
+
 initICMP=0
 initicmp=372
 
@@ -37,17 +41,17 @@ echo "TAINT	|	BLOCK NO. (If ANY)	|	OFFSET	"
 while read line;
 do
 	taintNo=$line
-	taint='t'$taintNo'='
-	taintDesc=`grep $taint /tmp/testfs.py | cut -d"=" -f2 | cut -d"#" -f1`
+	taint='t'$taintNo
+	taintDesc=`$QUERY def $taint | cut -d"=" -f2 | cut -d"#" -f1`
 	if [[ $taintDesc =~ "O" ]]; then
 		blockTaint=`echo $taintDesc | cut -d"(" -f2 | cut -d"," -f1`
-		blockTaint=$blockTaint'='
-		blockDesc=`grep $blockTaint /tmp/testfs.py`
-		blockNum=`echo $blockDesc | cut -d"," -f2`
+		blockNum=`$QUERY block $blockTaint | head -n 1`
 		offsetsMultiLines=`echo $taintDesc | grep -oP '\[\K[^\]]+'`
 		offsets=`echo $offsetsMultiLines | tr '\n' ' '`
 #		echo "$taint	|	 $taintDesc	|	$blockNum	|	$offsets	|"
-		echo "$taint	|	$blockNum	|	$offsets	|"
+		echo "$taint=	|	$blockNum	|	$offsets	|"
 	fi
 done < blockStructureTaintFile
 
+$QUERY shutdown
+
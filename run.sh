@@ -62,8 +62,9 @@ $DIR/llvm/build/bin/opt -reg2mem $1.inst2.bc -o $1.opt.bc
 
 $DIR/llvm/build/bin/clang++ -c $1.opt.bc -o $1.opt.o
 
-# create an exe out of the intermediate optimized file
+# create an exe out of the intermediate optimized file (zlib is used by the
+# runtime for FSLICE_COMPRESSED_TRACE)
 
-$DIR/llvm/build/bin/clang++ -o $1.exe $1.opt.o $LDFLAGS
+$DIR/llvm/build/bin/clang++ -o $1.exe $1.opt.o $LDFLAGS -lz
 
 echo "$1.exe created"
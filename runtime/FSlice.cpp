@@ -12,6 +12,10 @@
 #include <sstream>
 #include <algorithm>
 #include <stack>
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+#include <zlib.h>
 
 // Attribute packed is for space compaction. Any object instance created for Taint 
 // requires exactly 64 bits. If packed was not used, each attribute of the structure
@@ -58,6 +62,195 @@ struct SaveErrno {
   }
 };
 
+// Opt-in binary trace. When FSLICE_BINARY_TRACE names a file, the V, A, O, B,
+// M, N, D, S, ICMP and store events are written there as fixed-width records
+// instead of as Python lines on stderr. Operand lists (the bytes of an O, the
+// size dependencies of an M) go to <file>.ops, and the names of binary
+// operators and ICMP predicates go to <file>.str, one per line. Comment lines
+// are still printed on stderr. See visualize/post_processing/binaryTrace.py.
+
+struct BinaryRecord {
+  uint8_t kind;     // 'V', 'A', 'O', 'B', 'M', 'N', 'D', 'S', 'I' (ICMP), 's' (store)
+  uint8_t flag;     // A/ICMP: index into <file>.str; B: 'r'/'w'; M: is object;
+                    // store: where it came from, 'o' (Store of an object),
+                    // 'd' (__fslice_data), 'm' (memmove), 'w' (write_block)
+  uint16_t nops;    // number of operands in <file>.ops
+  uint32_t id;      // defined taint; store: destination taint
+  uint32_t a;       // A/ICMP: first operand; B: size taint; O: base taint;
+                    // store: source taint
+  uint32_t b;       // A/ICMP: second operand; B: block number taint
+  uint64_t x;       // V: value; B/M/N/D/S: size; O: address; store: destination
+                    // offset; A: #SWITCH taint (0 if none)
+  uint64_t y;       // B: block number; O: size; store: source offset;
+                    // A: #SWITCH block number
+} __attribute__((packed));
+
+struct BinaryOperand {
+  uint32_t id;
+  uint32_t offset;
+} __attribute__((packed));
+
+class BinaryTrace {
+ public:
+  BinaryTrace(void)
+      : records(nullptr), operands(nullptr), strings(nullptr) {
+    const char *path = getenv("FSLICE_BINARY_TRACE");
+    if (!path || !*path) return;
+    records = fopen(path, "wb");
+    operands = fopen((std::string(path) + ".ops").c_str(), "wb");
+    strings = fopen((std::string(path) + ".str").c_str(), "w");
+    if (!records || !operands || !strings) {
+      std::cerr << "# Cannot open binary trace " << path << std::endl;
+      Close();
+    }
+  }
+
+  ~BinaryTrace(void) {
+    Close();
+  }
+
+  bool Enabled(void) const {
+    return records != nullptr;
+  }
+
+  void Record(uint8_t kind, uint32_t id, uint32_t a = 0, uint32_t b = 0,
+              uint64_t x = 0, uint64_t y = 0, uint8_t flag = 0,
+              uint16_t nops = 0) {
+    const BinaryRecord r = {kind, flag, nops, id, a, b, x, y};
+    fwrite(&r, sizeof r, 1, records);
+  }
+
+  void Operand(uint32_t id, uint32_t offset) {
+    const BinaryOperand o = {id, offset};
+    fwrite(&o, sizeof o, 1, operands);
+  }
+
+  // Returns the index of name in <file>.str, adding it on first use.
+  uint8_t Name(const std::string &name) {
+    auto it = names.find(name);
+    if (it != names.end()) return it->second;
+    const auto index = static_cast<uint8_t>(names.size());
+    names[name] = index;
+    fprintf(strings, "%s\n", name.c_str());
+    return index;
+  }
+
+ private:
+  void Close(void) {
+    if (records) fclose(records);
+    if (operands) fclose(operands);
+    if (strings) fclose(strings);
+    records = operands = strings = nullptr;
+  }
+
+  FILE *records;
+  FILE *operands;
+  FILE *strings;
+  std::unordered_map<std::string, uint8_t> names;
+};
+
+static BinaryTrace gBinaryTrace;
+
+// Opt-in compressed trace. When FSLICE_COMPRESSED_TRACE names a file, the
+// lines printed on stderr are written there instead, as a sequence of gzip
+// members ("frames") holding whole lines, so zcat still reads the trace.
+// After every frame, its compressed and uncompressed start offsets are
+// appended to <file>.frames as two uint64_t, which lets the Python readers
+// seek to any line without decompressing the frames before it. See
+// visualize/post_processing/compressedTrace.py. Link with -lz.
+
+class CompressedTrace : public std::streambuf {
+ public:
+  CompressedTrace(void)
+      : out(nullptr), frames(nullptr), saved(nullptr), compressed(0),
+        uncompressed(0) {
+    const char *path = getenv("FSLICE_COMPRESSED_TRACE");
+    if (!path || !*path) return;
+    out = fopen(path, "wb");
+    frames = fopen((std::string(path) + ".frames").c_str(), "wb");
+    if (!out || !frames) {
+      std::cerr << "# Cannot open compressed trace " << path << std::endl;
+      Close();
+      return;
+    }
+    buffer.reserve(kFrameSize * 2);
+    saved = std::cerr.rdbuf(this);
+  }
+
+  ~CompressedTrace(void) {
+    if (saved) std::cerr.rdbuf(saved);
+    WriteFrame(buffer.size());
+    Close();
+  }
+
+ protected:
+  int overflow(int c) override {
+    if (c != EOF) {
+      buffer.push_back(static_cast<char>(c));
+      if (c == '\n') Cut();
+    }
+    return traits_type::not_eof(c);
+  }
+
+  std::streamsize xsputn(const char *s, std::streamsize n) override {
+    buffer.append(s, n);
+    Cut();
+    return n;
+  }
+
+ private:
+  // Uncompressed size after which a frame is cut at the last newline.
+  static const size_t kFrameSize = 1 << 20;
+
+  void Cut(void) {
+    if (buffer.size() < kFrameSize) return;
+    const auto end = buffer.rfind('\n');
+    if (end != std::string::npos) WriteFrame(end + 1);
+  }
+
+  // Compresses the first size bytes of the buffer into one gzip member.
+  void WriteFrame(size_t size) {
+    if (!out || !size) return;
+    z_stream z;
+    memset(&z, 0, sizeof z);
+    // 15 + 16: default window, with a gzip header and trailer.
+    deflateInit2(&z, Z_DEFAULT_COMPRESSION, Z_DEFLATED, 15 + 16, 8,
+                 Z_DEFAULT_STRATEGY);
+    std::vector<unsigned char> frame(deflateBound(&z, size) + 32);
+    z.next_in = reinterpret_cast<Bytef *>(&buffer[0]);
+    z.avail_in = size;
+    z.next_out = frame.data();
+    z.avail_out = frame.size();
+    deflate(&z, Z_FINISH);
+    const size_t frameSize = frame.size() - z.avail_out;
+    deflateEnd(&z);
+
+    fwrite(frame.data(), 1, frameSize, out);
+    fflush(out);
+    const uint64_t entry[2] = {compressed, uncompressed};
+    fwrite(entry, sizeof entry, 1, frames);
+    fflush(frames);
+    compressed += frameSize;
+    uncompressed += size;
+    buffer.erase(0, size);
+  }
+
+  void Close(void) {
+    if (out) fclose(out);
+    if (frames) fclose(frames);
+    out = frames = nullptr;
+  }
+
+  FILE *out;
+  FILE *frames;
+  std::streambuf *saved;
+  std::string buffer;
+  uint64_t compressed;
+  uint64_t uncompressed;
+};
+
+static CompressedTrace gCompressedTrace;
+
 // Try to merge things like binary operators, constants, and memory loads
 // into single taint nodes.
 #define CACHE 1
@@ -178,6 +371,13 @@ static Taint Load(uint64_t addr, uint64_t size) {
   Taint t = {gId++, 0, false};
 #endif
   auto sep = ",";
+  if (gBinaryTrace.Enabled()) {
+    gBinaryTrace.Record('O', t.id, gShadow[addr].id, 0, addr, size, 0, size);
+    for (auto i = 0U; i < size; ++i) {
+      const auto mt = gShadow[addr + i];
+      gBinaryTrace.Operand(mt.id, mt.offset);
+    }
+  } else {
 //  std::cerr << "t" << t.id << "=O(" << t.id;
   std::cerr << "t" << t.id << "=O(t" << gShadow[addr].id << "," << t.id;
   for (auto i = 0U; i < size; ++i) {
@@ -191,13 +391,14 @@ static Taint Load(uint64_t addr, uint64_t size) {
 	
     //sep = ",";
   }
+  std::cerr << ") # Load(" << addr << ", " << size << ")" << std::endl;
+  }
 //	Object refers to a block taint
 	if(std::find(gBlockTaintIds.begin(), gBlockTaintIds.end(), gShadow[addr].id) != gBlockTaintIds.end())
 	{
 		gObjectBlockTaintIds[t.id] = gShadow[addr].id;
 	}
 
-  std::cerr << ") # Load(" << addr << ", " << size << ")" << std::endl;
   return t;
 }
 
@@ -213,9 +414,13 @@ static void Store(uint64_t addr, uint64_t size, Taint t) {
   for (auto i = 0U; i < size; ++i) {
     auto &et = gShadow[addr + i];
     if (et.is_obj) {
+      if (gBinaryTrace.Enabled()) {
+        gBinaryTrace.Record('s', et.id, t.id, 0, et.offset, t.offset + i, 'o');
+      } else {
       std::cerr << "t" << et.id << "[" << et.offset << "]=t" << t.id
                 << "[" << (t.offset + i) << "] # Store::is_obj equals true."
                 << std::endl;
+      }
     } else {
       	  et = {t.id, t.offset + i, false}; // should be `taint.offset + i`?
     }
@@ -276,6 +481,11 @@ extern "C" Taint __fslice_load_arg(uint64_t i) {
 // TODO : FIX this - fix is trivial, but I need some sleep...
 
 extern "C" void __fslice_run_on_icmp(Taint Taint1, Taint Taint2, uint64_t Pred) {
+	if (gBinaryTrace.Enabled()) {
+		gBinaryTrace.Record('I', 0, Taint1.id, Taint2.id, 0, 0,
+				gBinaryTrace.Name(Comparator[Pred]));
+		return;
+	}
 	std::cerr << "ICMP(t" << Taint1.id << ",t" << Taint2.id << ",'"<< Comparator[Pred] << "')" << std::endl;
 }
 
@@ -321,9 +531,13 @@ extern "C" void *__fslice_memmove(void *dst, const void *src, uint64_t size) {
 			break;
 	}
 	// S is a statically assigned memory region - a constant string or a stack allocated memory (local variable)
-	if (newTaint != 0)
-		std::cerr << "t" << newTaint << "=S(" << size << ", " << newTaint << ")"
-				<< std::endl;
+	if (newTaint != 0) {
+		if (gBinaryTrace.Enabled())
+			gBinaryTrace.Record('S', newTaint, 0, 0, size);
+		else
+			std::cerr << "t" << newTaint << "=S(" << size << ", " << newTaint << ")"
+					<< std::endl;
+	}
 
 	for (auto i = 0U; i < size; ++i) {
 		const auto bt = gShadow[saddr + i];
@@ -342,6 +556,10 @@ extern "C" void *__fslice_memmove(void *dst, const void *src, uint64_t size) {
 		//			<< std::endl;
 		//		}else{
 				// dont print offset
+				if (gBinaryTrace.Enabled())
+					gBinaryTrace.Record('s', gShadow[daddr + i].id, bt.id, 0,
+							gShadow[daddr + i].offset, 0, 'm');
+				else
 					std::cerr << "t" << gShadow[daddr + i].id << "[" << gShadow[daddr + i].offset << "]=t"
 					<< bt.id << " # fslice_memmove"
 					<< std::endl;
@@ -388,8 +606,13 @@ extern "C" void *__fslice_malloc(uint64_t size) {
   const auto addr = reinterpret_cast<uint64_t>(ptr);
   Taint t = {gId++, 0,false};
 
+  if (gBinaryTrace.Enabled()) {
+    gBinaryTrace.Record('M', t.id, 0, 0, size, 0, MEM, 1);
+    gBinaryTrace.Operand(__fslice_load_arg(0).id, 0);
+  } else {
   std::cerr << "t" << t.id << "=M(" << size << ", " << MEM << ", " << t.id
 			<< ",t" << __fslice_load_arg(0).id << ")" << std::endl;
+  }
 
   for (auto i = 0U; i < size; ++i) {
     gShadow[addr + i] = {t.id, i, MEM}; // MEM -treat heap allocated objects as separate objects
@@ -418,9 +641,15 @@ extern "C" void *__fslice_calloc(uint64_t num, uint64_t size) {
   auto ptr = calloc(num, size);
   const auto addr = reinterpret_cast<uint64_t>(ptr);
   Taint t = {gId++, 0,false};
+  if (gBinaryTrace.Enabled()) {
+    gBinaryTrace.Record('M', t.id, 0, 0, size, 0, MEM, 2);
+    gBinaryTrace.Operand(__fslice_load_arg(0).id, 0);
+    gBinaryTrace.Operand(__fslice_load_arg(1).id, 0);
+  } else {
   std::cerr << "t" << t.id << "=M(" << size << ", " << MEM << ", " << t.id
 			<< ",t" << __fslice_load_arg(0).id << ",t"
             << __fslice_load_arg(1).id << ")" << std::endl;
+  }
 
   for (auto i = 0U; i < num * size; ++i) {
     gShadow[addr + i] = {t.id, i, MEM};
@@ -436,8 +665,11 @@ extern "C" Taint __fslice_value(uint64_t val) {
 	auto &t = gValues[val];
 	if (/*val && */ !t.id) {
 		t = { gId++, 0, false};
-		std::cerr << "t" << t.id << "=V(" << val << ", " << t.id << ")" << " # "
-				<< TaintAsString(t) << std::endl;
+		if (gBinaryTrace.Enabled())
+			gBinaryTrace.Record('V', t.id, 0, 0, val);
+		else
+			std::cerr << "t" << t.id << "=V(" << val << ", " << t.id << ")" << " # "
+					<< TaintAsString(t) << std::endl;
 		gValues[val] = t;
 		gTaintValue.push_back(t.id);
 	}
@@ -446,7 +678,10 @@ extern "C" Taint __fslice_value(uint64_t val) {
 #else
 	/*if (val) { */
 		Taint t = {gId++, 0, false};
-		std::cerr << "t" << t.id << "=V(" << val << ", " << t.id << ")" << " # " << TaintAsString(t) << std::endl;
+		if (gBinaryTrace.Enabled())
+			gBinaryTrace.Record('V', t.id, 0, 0, val);
+		else
+			std::cerr << "t" << t.id << "=V(" << val << ", " << t.id << ")" << " # " << TaintAsString(t) << std::endl;
 		gTaintValue.push_back(t.id);
 		return t;
 	/*} else {
@@ -465,21 +700,37 @@ extern "C" Taint __fslice_op2(const char *op, Taint t1, Taint t2) {
   auto &t = gBinaryOps[op][id];
   if (!t.id) {
     t = {gId++, 0, false};
+    const bool is_switch =
+        gObjectBlockTaintIds.find(t1.id) != gObjectBlockTaintIds.end();
+    if (gBinaryTrace.Enabled()) {
+      gBinaryTrace.Record('A', t.id, t1.id, t2.id, is_switch ? t1.id : 0,
+                          is_switch ? gTaintBlockMap[gObjectBlockTaintIds[t1.id]] : 0,
+                          gBinaryTrace.Name(op));
+    } else {
     std::cerr << "t" << t.id << "=A(\"" << op << "\",t" << t1.id
               << ",t" << t2.id << ", " << t.id << ")";
-	if(gObjectBlockTaintIds.find(t1.id) != gObjectBlockTaintIds.end())
+	if(is_switch)
 		std::cerr << "#SWITCH " << t1.id << " " << gTaintBlockMap[gObjectBlockTaintIds[t1.id]] << std::endl;
 	else
 		std::cerr << std::endl;
+    }
   }
 #else
   Taint t = {gId++, 0, false};
+  const bool is_switch =
+      gObjectBlockTaintIds.find(t2.id) != gObjectBlockTaintIds.end();
+  if (gBinaryTrace.Enabled()) {
+    gBinaryTrace.Record('A', t.id, t1.id, t2.id, is_switch ? t2.id : 0,
+                        is_switch ? gTaintBlockMap[gObjectBlockTaintIds[t2.id]] : 0,
+                        gBinaryTrace.Name(op));
+  } else {
   std::cerr << "t" << t.id << "=A(\"" << op << "\",t" << t1.id
             << ",t" << t2.id << ", " << t.id << ")" << std::endl;
-	if(gObjectBlockTaintIds.find(t2.id) != gObjectBlockTaintIds.end())
+	if(is_switch)
 		std::cerr << "#SWITCH " << t2.id << " " << gTaintBlockMap[gObjectBlockTaintIds[t2.id]] << std::endl;
 	else
 		std::cerr << std::endl;
+  }
 #endif
   if(isSymbol(t1.id) || isSymbol(t2.id)){
 	addSymbol(t.id);
@@ -504,9 +755,12 @@ static Taint GetBlock(uint64_t size, uint64_t nr, char path) {
 		std::cerr << "#gBlockTAINT " << t.id << std::endl;
 		const auto st = __fslice_load_arg(1);  // Taint for the size :-)
 		const auto nt = __fslice_load_arg(2);  // Taint for the block number :-)
-		std::cerr << "t" << t.id << "=B(" << size << "," << nr << ",t" << st.id
-				<< ",t" << nt.id << ", " << t.id << ") # GetBlock(" << size
-				<< ", " << nr << ") " << path << std::endl;
+		if (gBinaryTrace.Enabled())
+			gBinaryTrace.Record('B', t.id, st.id, nt.id, size, nr, path);
+		else
+			std::cerr << "t" << t.id << "=B(" << size << "," << nr << ",t" << st.id
+					<< ",t" << nt.id << ", " << t.id << ") # GetBlock(" << size
+					<< ", " << nr << ") " << path << std::endl;
 		gTaintBlockMap[t.id] = nr;
 		__fslice_store_ret( { 0, 0, false});
 	} else {
@@ -599,6 +853,9 @@ extern "C" void __fslice_write_block(uint64_t addr, uint64_t size, uint64_t nr)
 //			  << bt.offset << "] # fslice_write_block(" << addr << ", "
 //			  << size << ", " << nr << ")" << std::endl;
 //	}else{
+    if (gBinaryTrace.Enabled())
+      gBinaryTrace.Record('s', t.id, bt.id, 0, i, 0, 'w');
+    else
     std::cerr << "t" << t.id << "[" << i << "]=t" << bt.id << "# fslice_write_block(" << addr << ", "
 			  << size << ", " << nr << ")" << std::endl;
 //	}
@@ -612,6 +869,9 @@ extern "C" void __fslice_write_block(uint64_t addr, uint64_t size, uint64_t nr)
 extern "C" void __fslice_name(uint64_t addr, uint64_t len) {
   SaveErrno save_errno;
   Taint t = {gId++, 0, false};
+  if (gBinaryTrace.Enabled())
+    gBinaryTrace.Record('N', t.id, 0, 0, len);
+  else
   std::cerr << "t" << t.id << "=N(" << len << ", " << t.id << ")"
 			<< std::endl;
 
@@ -627,12 +887,18 @@ extern "C" void __fslice_name(uint64_t addr, uint64_t len) {
 extern "C" void __fslice_data(uint64_t addr, uint64_t len) {
   SaveErrno save_errno;
   Taint t = {gId++, 0, false};
+  if (gBinaryTrace.Enabled())
+    gBinaryTrace.Record('D', t.id, 0, 0, len);
+  else
   std::cerr << "t" << t.id << "=D(" << len << ", " << t.id << ")"
 			<< std::endl;
 
   for (auto i = 0U; i < len; ++i) {
     auto &bt = gShadow[addr + i];
     if (bt.id) {
+      if (gBinaryTrace.Enabled())
+        gBinaryTrace.Record('s', t.id, bt.id, 0, i, bt.offset, 'd');
+      else
       std::cerr << "t" << t.id << "[" << i << "]=t" << bt.id
                 << "[" << bt.offset << "]" << std::endl;
     }
@@ -1,20 +1,25 @@
 #!/usr/bin/env bash
 
 # Verify that the input arguments are correct.
-if [ "$#" -ne 1 ]; then
+if [ "$#" -lt 1 ] || [ "$#" -gt 3 ]; then
 	echo "Wrong number of arguments!"
-	echo "Usage: ./${0##*/} <file-with-tainted-operations>"
+	echo "Usage: ./${0##*/} <file-with-tainted-operations> [<blocks, e.g. 64-191,200> [<hops>]]"
 	exit -1
 fi
 
+# Only draw the neighborhood of the given blocks (2 hops by default).
+neighborhood=""
+if [ "$#" -ge 2 ]; then
+	neighborhood="--blocks $2 --hops ${3:-2}"
+fi
+
 # Prints the full path of the current directory.
 DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )
 
-# Create a temporary Python file to process the generated tainted operations.
-cat $DIR/visualize/head.py $1 $DIR/visualize/tail.py > /tmp/visualize.py
-
-# Create a visualization using the dot language.
-python /tmp/visualize.py > /tmp/visualize.dot
+# Create a visualization using the dot language. The tainted operations are
+# interpreted line by line by the classes in head.py.
+python $DIR/visualize/interpret.py $DIR/visualize/head.py $1 $DIR/visualize/tail.py -- \
+	--graph $neighborhood > /tmp/visualize.dot
 
 # Invoke the dot viewer.
 xdot /tmp/visualize.dot
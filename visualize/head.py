@@ -1,68 +1,307 @@
+from __future__ import print_function
+
 import argparse
 import collections
 import json
+import os
 import time
 import sys
 
+import numpy as np
+
+from interpret import runTrace
+
+
+def blockList(text):
+    """
+    Parses a block list such as "64-191,200" into a set of block numbers.
+    """
+    numbers = set()
+    try:
+        for part in text.split(','):
+            first, _, last = part.partition('-')
+            numbers.update(range(int(first), int(last or first) + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError("invalid block list: {}".format(text))
+    return numbers
+
+
 parser = argparse.ArgumentParser(description='Calculate output graph.')
 parser.add_argument('--metadata', dest='PRINT_METADATA', const=True, default=False,
                     nargs='?', help='Print metadata.')
 parser.add_argument('--graph', dest='PRINT_GRAPH', const=True, default=False,
                     nargs='?', help='Print the output graph.')
+parser.add_argument('--coarse-graph', dest='COARSE_GRAPH', const=True, default=False,
+                    nargs='?', help='Print the output graph aggregated to blocks.')
+parser.add_argument('--coarse-objects', dest='COARSE_OBJECTS', type=int, default=32,
+                    help='Most objects of one kind drawn separately by --coarse-graph (default: 32); '
+                         'more are drawn as one node.')
+parser.add_argument('--blocks', dest='BLOCKS', type=blockList, default=None,
+                    help='Limit the output graph to these blocks and their neighborhood, e.g. 64-191,200.')
+parser.add_argument('--hops', dest='HOPS', type=int, default=2,
+                    help='Radius of the neighborhood printed with --blocks (default: 2, -1 for no limit).')
+parser.add_argument('--lazy', dest='LAZY', const=True, default=False,
+                    nargs='?', help='Only build what --metadata and --enum need (no graph).')
 parser.add_argument('--enum', dest='DETECT_ENUMS', const=True, default=False,
                     nargs='?', help='Detect possible enums.')
+parser.add_argument('--enum-types', dest='ENUM_TYPES', default='testfs_output.dat',
+                    help='Block types checked by --enum: a JSON map or a .npy matrix '
+                         '(default: testfs_output.dat, see loadBlockTypes).')
+parser.add_argument('--enum-blocks', dest='ENUM_BLOCKS', type=blockList, default='64-191',
+                    help='Blocks whose values --enum prints (default: 64-191, the inode blocks).')
 parser.add_argument('--verbose', dest='VERBOSE', const=True, default=False,
                     nargs='?', help='Print information in detail.')
 parser.add_argument('--debug', dest='DEBUG', const=True, default=False,
                     nargs='?', help='Print debug information.')
 
-args = parser.parse_args()
+
+def parseArgs(argv=None):
+    """
+    Parses the head arguments in argv (default: sys.argv).
+    """
+    args = parser.parse_args(argv)
+    if args.LAZY and (args.PRINT_GRAPH or args.COARSE_GRAPH):
+        parser.error("--lazy does not build the graph")
+    if args.PRINT_GRAPH and args.COARSE_GRAPH:
+        # Each prints a digraph of its own, and a DOT file holds one.
+        parser.error("--graph and --coarse-graph cannot be combined")
+    return args
+
 
 # Constants.
 POINTER_SIZE = 4
 BLOCK_SIZE = 64
 
-# Data types.
-pointerList = collections.defaultdict(list)
-pointerSet = set()
-valueSet = collections.defaultdict(int)
-dataSet = set()
-nameSet = set()
-
-# Block types.
-directory_entry_blocks = collections.defaultdict(list)
-data_blocks = set()
-name_bytes_per_block = collections.defaultdict(list)
-data_bytes_per_block = collections.defaultdict(list)
-
-
-def isDataBlock(block_number):
-    if args.DEBUG:
-        print("[DEBUG, {}]: Checking for data blocks, Block {} contains [{}, {}]".\
-            format(time.time(), block_number,
-                   len(name_bytes_per_block[block_number]),
-                   len(data_bytes_per_block[block_number])))
-
-    if len(name_bytes_per_block[block_number]) > 0:
-        return False
-    elif len(data_bytes_per_block[block_number]) > 0:
-        return True
+# post_processing/ holds the trace index used by --lazy.
+POST_PROCESSING = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'post_processing')
+
+
+# Flags of DiskBytes.flags.
+POINTER = 1
+DATA = 2
+NAME = 4
+VALUE = 8
+# The value was read by a folded node (see DiskBytes.readValue).
+READ = 16
+
+
+class DiskBytes(object):
+    """
+    What is known about every byte of the disk, indexed by disk offset
+    (nr * size + byte): the value stored at the byte and a bit mask of
+    POINTER, DATA, NAME and VALUE flags. Both are dense NumPy arrays that
+    grow, a block at a time and by doubling, to the highest block seen.
+
+    generation changes whenever a value that a node folded (see
+    foldedValue) is overwritten, which makes every folded value stale.
+    """
+
+    def __init__(self):
+        self.values = np.zeros(0, np.int64)
+        self.flags = np.zeros(0, np.uint8)
+        # Values that are not plain ints (longs, strings, ...), by offset,
+        # kept as they are: A.getValue only folds ints.
+        self.objects = {}
+        self.generation = 0
+
+    def _grow(self, offset):
+        if offset < len(self.flags):
+            return
+        size = max(2 * len(self.flags), (offset // BLOCK_SIZE + 1) * BLOCK_SIZE)
+        values = np.zeros(size, np.int64)
+        values[:len(self.values)] = self.values
+        flags = np.zeros(size, np.uint8)
+        flags[:len(self.flags)] = self.flags
+        self.values, self.flags = values, flags
+
+    def mark(self, offset, flag):
+        self._grow(offset)
+        self.flags[offset] |= flag
+
+    def isMarked(self, offset, flag):
+        return offset < len(self.flags) and bool(self.flags[offset] & flag)
+
+    def setValue(self, offset, value):
+        if self.isMarked(offset, READ):
+            old = self.getValue(offset)
+            if type(old) is not type(value) or old != value:
+                self.generation += 1
+        self.mark(offset, VALUE)
+        if type(value) is int:
+            self.values[offset] = value
+            self.objects.pop(offset, None)
+        else:
+            self.objects[offset] = value
+
+    def getValue(self, offset):
+        """
+        Returns the value stored at offset, or None.
+        """
+        if not self.isMarked(offset, VALUE):
+            return None
+        if offset in self.objects:
+            return self.objects[offset]
+        return int(self.values[offset])
+
+    def readValue(self, offset):
+        """
+        Returns the value stored at offset, or None, for a node that folds
+        it: overwriting the value later starts a new generation.
+        """
+        self.mark(offset, READ)
+        return self.getValue(offset)
+
+    def count(self, flag):
+        return int(np.count_nonzero(self.flags & flag))
+
+    def offsets(self, flag, start=0, stop=None):
+        """
+        Returns the sorted offsets in [start, stop) that have flag set.
+        """
+        return np.flatnonzero(self.flags[start:stop] & flag) + start
+
+    def lookup(self, offsets):
+        """
+        Returns the flags and values at an array of offsets, 0 past the
+        highest block seen.
+        """
+        inside = offsets < len(self.flags)
+        flags = np.zeros(offsets.shape, np.uint8)
+        values = np.zeros(offsets.shape, np.int64)
+        flags[inside] = self.flags[offsets[inside]]
+        values[inside] = self.values[offsets[inside]]
+        return flags, values
+
+    def formatValues(self):
+        return "{{{}}}".format(", ".join("{}: {!r}".format(offset, self.getValue(offset))
+                                         for offset in self.offsets(VALUE)))
+
+
+# Type of the bytes of blocks without types in a block type matrix.
+NO_TYPE = ''
+
+
+class BlockTypesError(Exception):
+    """
+    Raised by --enum when a pointer points into a block without types.
+    """
+    pass
+
+
+def loadTraceIndex(trace_file):
+    """
+    Returns the TraceIndex of trace_file (see post_processing/traceIndex.py).
+    """
+    if POST_PROCESSING not in sys.path:
+        sys.path.insert(0, POST_PROCESSING)
+    from traceIndex import getTraceIndex
+    return getTraceIndex(trace_file)
+
+
+def loadBlockTypes(path):
+    """
+    Loads the type ('D', 'P', ...) of every byte of the disk, as a matrix of
+    one-character strings with one row of BLOCK_SIZE types per block number
+    and rows of NO_TYPE for blocks without types. path is either such a
+    matrix saved with np.save (.npy), or a JSON map from block numbers to
+    the lists of their types, like testfs_output.dat.
+    """
+    if path.endswith('.npy'):
+        types = np.load(path).astype('S1')
     else:
-        return False
+        with open(path, 'r') as file:
+            blockDPMap = json.load(file)
+        rows = max(int(block) for block in blockDPMap) + 1 if blockDPMap else 0
+        types = np.zeros((rows, BLOCK_SIZE), 'S1')
+        for block, block_types in blockDPMap.items():
+            assert(len(block_types) == BLOCK_SIZE)
+            types[int(block)] = block_types
+
+    # Verify that the input data is correct.
+    assert(types.ndim == 2 and types.shape[1] == BLOCK_SIZE)
+    return types
+
+
+# Value of the folded field of A and Select before their value is first
+# asked for, and the folded value of a node that is not a constant (whose
+# getValue is None).
+NOT_FOLDED = object()
+NOT_CONSTANT = object()
+
+
+def foldedValue(node):
+    """
+    Returns node.fold(), computed once per disk generation: a block write
+    asks for the value of every byte it stores, and the operand trees of
+    those bytes are shared.
+    """
+    generation = node.graph.disk.generation
+    if node.folded is NOT_FOLDED or node.foldedAt != generation:
+        value = node.fold()
+        node.folded = NOT_CONSTANT if value is None else value
+        node.foldedAt = generation
+    if node.folded is NOT_CONSTANT:
+        return None
+    return node.folded
+
+
+# Byte sources of every node that has none. Nodes share this map until their
+# first byte is assigned (see Base.__setitem__), so it is never written to.
+NO_BYTE_SOURCES = {}
+
+# Selects of every node that has not been indexed yet (see Base.select).
+NO_SELECTS = ()
 
 
+# Nodes use __slots__: a trace creates one node per taint and one Select per
+# byte read, and a __dict__ (plus a byte_sources dict) per node made the
+# graph of large traces several times bigger than the taints it holds.
+#
+# The classes below are not instantiated directly: every TraceGraph makes a
+# subclass of each with graph set to itself, and the trace builds its nodes
+# with those.
 class Base(object):
+    __slots__ = ('size', 'byte_sources', 'taintID', 'seen', 'selects')
+    graph = None
+
     def __init__(self, taintID=""):
         self.size = 1
-        self.byte_sources = {}
+        self.byte_sources = NO_BYTE_SOURCES
         self.taintID = taintID
-        self.seen = False
+        self.seen = 0
+        self.selects = NO_SELECTS
 
     def __getitem__(self, byte):
         self.size = max(self.size, byte + 1)
-        return Select(self, byte)
+        return self.select(byte)
+
+    def select(self, byte):
+        # A node is indexed at the same bytes over and over (every load of a
+        # pointer reads the same 4 bytes), so the Select of a byte is made
+        # once and shared by every tN[byte]. selects is a list indexed by
+        # byte while the bytes read are the first few of the node. A read at
+        # BLOCK_SIZE or above (a byte of a D/S/M buffer) turns it into a dict
+        # instead of padding the list up to that byte.
+        selects = self.selects
+        if type(selects) is dict:
+            select = selects.get(byte)
+        elif byte < BLOCK_SIZE:
+            if byte >= len(selects):
+                selects = self.selects = list(selects) + [None] * (byte + 1 - len(selects))
+            select = selects[byte]
+        else:
+            selects = self.selects = dict((i, s) for i, s in enumerate(selects) if s is not None)
+            select = None
+        if select is None:
+            select = selects[byte] = self.graph.Select(self, byte)
+        return select
 
     def __setitem__(self, byte, val):
+        # Byte sources are only printed in the graph.
+        if self.graph.args.LAZY:
+            return
+        if self.byte_sources is NO_BYTE_SOURCES:
+            self.byte_sources = {}
         self.byte_sources[byte] = val
 
     def getName(self):
@@ -82,7 +321,10 @@ class Base(object):
     def markPointer(self, byte, block_number):
         pass
 
-    def markPointers(self, block_number):
+    def markPointers(self, block_number, work, epoch):
+        # Marks the pointers this node was computed from, for block
+        # block_number, and appends the nodes to visit next to work (the
+        # last one appended is visited first).
         pass
 
     def getValue(self):
@@ -93,30 +335,30 @@ class Base(object):
 
 
 class Select(Base):
+    __slots__ = ('parent', 'byte', 'folded', 'foldedAt')
+
     def __init__(self, parent, byte):
         Base.__init__(self, parent.taintID)
         self.parent = parent
         self.byte = byte
-        self.seen = False
+        self.folded = NOT_FOLDED
+        self.foldedAt = 0
 
-    def markPointers(self, block_number):
-        if self.seen:
-            return
-
-        self.seen = True
+    def markPointers(self, block_number, work, epoch):
+        self.seen = epoch
 
         if self.parent.getName() == 'B':
             self.parent.markPointer(self.byte, block_number)
         else:
-            self.parent.markPointers(block_number)
+            work.append(self.parent)
 
     def getValue(self):
+        return foldedValue(self)
+
+    def fold(self):
         if self.parent.getName() == 'B':
             offset = (self.parent.nr * self.parent.size) + self.byte
-            if offset in valueSet:
-                return valueSet[offset]
-            else:
-                return None
+            return self.graph.disk.readValue(offset)
         else:
             return self.parent.getValue()
 
@@ -128,32 +370,35 @@ class Select(Base):
 
 
 class V(Base):
+    __slots__ = ('val', 'usedAsPointer')
+
     def __init__(self, val, taintID):
         Base.__init__(self, taintID)
         self.val = val
         self.usedAsPointer = False
 
     def Print(self, next, edges):
-        print("{} [label=\"{{{{{}}}|{}}}\"];".format(self.Label(), self._bytes(), self.val))
+        print("{} [label=\"{{{{{}}}|{}}}\"];".format(self.Label(), self._bytes(), self.val), file=self.graph.out)
 
     def getValue(self):
         return self.val
 
 
 class A(Base):
+    __slots__ = ('op', 'left', 'right', 'folded', 'foldedAt')
+
     def __init__(self, op, a, b, taintID):
         Base.__init__(self, taintID)
         self.op = op
         self.left = a
         self.right = b
+        self.folded = NOT_FOLDED
+        self.foldedAt = 0
 
-    def markPointers(self, block_number):
-        if self.seen:
-            return
-
-        self.seen = True
-        self.left.markPointers(block_number)
-        self.right.markPointers(block_number)
+    def markPointers(self, block_number, work, epoch):
+        self.seen = epoch
+        work.append(self.right)
+        work.append(self.left)
 
     def Print(self, next, edges):
         if self.left.getName() == 'V':
@@ -171,9 +416,12 @@ class A(Base):
             edges.add("{}:right -> {} [ label=\"t{}\" ];".format(self.Label(), self.right.Label(), self.right.taintID))
 
         print("{} [color=blue label=\"{{ {{ {} }} | {{ {} | t{} }} | {{{}|{}}} }}\"];".format(
-            self.Label(), self._bytes(), self.op, self.taintID, LL, RL))
+            self.Label(), self._bytes(), self.op, self.taintID, LL, RL), file=self.graph.out)
 
     def getValue(self):
+        return foldedValue(self)
+
+    def fold(self):
         lvalue = self.left.getValue()
         rvalue = self.right.getValue()
         if isinstance(lvalue, int) and isinstance(rvalue, int):
@@ -189,65 +437,61 @@ class A(Base):
                 return lvalue ^ rvalue
             else:
                 print("[DEBUG, {}]: Undefined Binary Operation {} for taint {}"
-                      .format(time.time(), self.op, self.taintID))
+                      .format(time.time(), self.op, self.taintID), file=self.graph.out)
                 return None
         else:
             return None
 
 
 class O(Base):
+    __slots__ = ('bytes',)
+
     def __init__(self, _, taintID, *bytes):
         Base.__init__(self, taintID)
         self.bytes = bytes
         self.size = len(self.bytes)
 
-    def markPointers(self, block_number):
-        # If the object has already been processed, then return.
-        if self.seen:
-            return
-
+    def markPointers(self, block_number, work, epoch):
         # Check for pointers only in objects whose size equals to POINTER_SIZE.
         if self.size != POINTER_SIZE:
             return
 
+        # Mark the object as processed, so that the sweep visits it once.
+        self.seen = epoch
+
         # Verify that the specified objects contains four consecutive bytes
         # that correspond to the same taint ID.
         for i in range(1, len(self.bytes)):
             # The taint ID must be the same in all POINTER_SIZE bytes.
             if self.bytes[i].taintID != self.bytes[i-1].taintID:
-                self.seen = True
                 return
 
             # All POINTER_SIZE bytes must be consecutive.
             if (self.bytes[i].byte - 1) != self.bytes[i-1].byte:
-                self.seen = True
                 return
 
-        # Mark the object as processed, in order to speed up the recursion.
-        self.seen = True
-
-        for i in range(0, self.size):
-            self.__getitem__(i).markPointers(block_number)
+        for i in reversed(range(0, self.size)):
+            work.append(self.__getitem__(i))
 
     def __getitem__(self, byte):
         self.size = max(self.size, byte + 1)
         if byte < len(self.bytes):
             return self.bytes[byte]
         else:
-            return Select(self, byte)
+            return self.select(byte)
 
     def getValue(self):
         return self.bytes[0].getValue()
 
     def Print(self, next, edges):
-        print("{} [label=\"{{{{}}|{{{}}}}}\"];".format(self.Label(), self._bytes()))
+        print("{} [label=\"{{{{}}|{{{}}}}}\"];".format(self.Label(), self._bytes()), file=self.graph.out)
         for i, b in enumerate(self.bytes):
             next.add(b)
             edges.add("{}:b{} -> {} [ label=\"t{}\" ];".format(self.Label(), i, b.Label(), b.taintID))
 
 
 class B(Base):
-    BLOCKS = []
+    __slots__ = ('nr', 'block_size', 'block_nr', 'data_bytes', 'name_bytes')
 
     def __init__(self, size, nr, block_size, block_nr, taintID):
         Base.__init__(self, taintID)
@@ -255,64 +499,71 @@ class B(Base):
         self.nr = nr
         self.block_size = block_size
         self.block_nr = block_nr
-        self.BLOCKS.append(self)
+        graph = self.graph
+        if not graph.args.LAZY:
+            graph.blocks.append(self)
+        graph.block_numbers.add(nr)
         self.data_bytes = 0
         self.name_bytes = 0
 
         # Search for on-disk pointers by following taints in
         # a backwards fashion.
-        block_size.markPointers(self.nr)
-        block_nr.markPointers(self.nr)
+        graph.markBlockPointers((self,))
 
     def __setitem__(self, byte, val):
         Base.__setitem__(self, byte, val)
+        disk = self.graph.disk
 
         if val.parent.getName() == 'V':
-            valueSet[(self.nr * self.size) + byte] = val.parent.val
+            disk.setValue((self.nr * self.size) + byte, val.parent.val)
         elif val.parent.getName() == 'A':
             operatorValue = val.parent.getValue()
             if operatorValue is not None:
-                valueSet[(self.nr * self.size) + byte] = operatorValue
+                disk.setValue((self.nr * self.size) + byte, operatorValue)
         elif val.parent.getName() == 'B':
             byte_value = val.getValue()
             if byte_value is not None:
-                valueSet[(self.nr * self.size) + byte] = byte_value
+                disk.setValue((self.nr * self.size) + byte, byte_value)
         #
         # elif val.parent.getName() == 'D':
-        #     if args.DEBUG:
+        #     if self.graph.args.DEBUG:
         #         print("[DEBUG, {}]: Inside block {} with offset {} and value {} and {}".\
         #             format(time.time(), self.nr, byte, val.taintID, val.parent.getByte(byte).parent.taintID))
         #
         #     if val.parent.getByte(val.byte).parent.getName() == 'N':
-        #         nameSet.add((self.nr * self.size) + byte)
-        #         directory_entry_blocks[self.nr].append(self)
-        #         name_bytes_per_block[self.nr].append(byte)
+        #         disk.mark((self.nr * self.size) + byte, NAME)
+        #         self.graph.directory_entry_blocks[self.nr].append(self)
+        #         self.graph.name_bytes_per_block[self.nr].append(byte)
         #     else:
-        #         dataSet.add((self.nr * self.size) + byte)
-        #         data_bytes_per_block[self.nr].append(byte)
+        #         disk.mark((self.nr * self.size) + byte, DATA)
+        #         self.graph.data_bytes_per_block[self.nr].append(byte)
         #
-        elif args.DEBUG:
+        elif self.graph.args.DEBUG:
                 print("[DEBUG, {}]: Ignoring type {}({}) in block's {}({}) assignment operator for byte {}.".\
-                    format(time.time(), val.parent.getName(), val.parent.taintID, self.nr, self.taintID, byte))
+                    format(time.time(), val.parent.getName(), val.parent.taintID, self.nr, self.taintID, byte),
+                    file=self.graph.out)
 
     def markPointer(self, byte, block_number):
+        graph = self.graph
+        disk = graph.disk
         disk_offset = (self.size * self.nr) + byte
-        pointerList[block_number].append(disk_offset)
+        graph.pointerList[block_number].append(disk_offset)
 
-        if args.DEBUG:
-            if disk_offset in pointerSet:
+        if graph.args.DEBUG:
+            if disk.isMarked(disk_offset, POINTER):
                 print("[DEBUG, {}]: Byte {} is already marked as part of a pointer.".\
-                    format(time.time(), disk_offset))
+                    format(time.time(), disk_offset), file=graph.out)
 
-        pointerSet.add(disk_offset)
-        if args.DEBUG:
-            print("[DEBUG, {}]: Byte {} was marked as part of a pointer.".format(time.time(), disk_offset))
+        disk.mark(disk_offset, POINTER)
+        if graph.args.DEBUG:
+            print("[DEBUG, {}]: Byte {} was marked as part of a pointer.".format(time.time(), disk_offset),
+                  file=graph.out)
             print("[DEBUG, {}]: Byte {} in block {} with taintID {} points to block {}".\
-                format(time.time(), byte, self.nr, self.taintID, block_number))
+                format(time.time(), byte, self.nr, self.taintID, block_number), file=graph.out)
 
     def Print(self, next, edges):
         print("{} [rank=max fillcolor=grey style=filled label=\"{{{{{}}}|{{<size>size = {} | <nr>nr = {} | <tid>tid = {}}}}}\"];" \
-            .format(self.Label(), self._bytes(), self.size, self.nr, self.taintID))
+            .format(self.Label(), self._bytes(), self.size, self.nr, self.taintID), file=self.graph.out)
 
         if self.block_size.getName() != 'V':
             next.add(self.block_size)
@@ -326,25 +577,31 @@ class B(Base):
 
 
 class NT(Base):
+    __slots__ = ()
+
     def __init__(self, taintID):
         Base.__init__(self, taintID)
 
     def Print(self, next, edges):
         print("{} [fillcolor=yellow2 style=filled label=\"{{{{{}}} | {{<size>size = {} | t{} }}}}\"];" \
-            .format(self.Label(), self._bytes(), self.size, self.taintID))
+            .format(self.Label(), self._bytes(), self.size, self.taintID), file=self.graph.out)
 
 
 class N(Base):
+    __slots__ = ()
+
     def __init__(self, size, taintID):
         Base.__init__(self, taintID)
         self.size = size
 
     def Print(self, next, edges):
         print("{} [fillcolor=green style=filled label=\"{{{{{}}} | {{<size>size = {} | t{} }}}}\"];" \
-            .format(self.Label(), self._bytes(), self.size, self.taintID))
+            .format(self.Label(), self._bytes(), self.size, self.taintID), file=self.graph.out)
 
 
 class D(Base):
+    __slots__ = ()
+
     def __init__(self, size, taintID):
         Base.__init__(self, taintID)
         self.size = size
@@ -357,10 +614,12 @@ class D(Base):
 
     def Print(self, next, edges):
         print("{} [fillcolor=orange style=filled label=\"{{{{{}}} | {{<size>size = {} | t{} }}}}\"];" \
-            .format(self.Label(), self._bytes(), self.size, self.taintID))
+            .format(self.Label(), self._bytes(), self.size, self.taintID), file=self.graph.out)
 
 
 class S(Base):
+    __slots__ = ()
+
     def __init__(self, size, taintID):
         Base.__init__(self, taintID)
         self.size = size
@@ -373,10 +632,12 @@ class S(Base):
 
     def Print(self, next, edges):
         print("{} [fillcolor=orange style=filled label=\"{{{{{}}} | {{<size>size = {} | t{} }}}}\"];" \
-            .format(self.Label(), self._bytes(), self.size, self.taintID))
+            .format(self.Label(), self._bytes(), self.size, self.taintID), file=self.graph.out)
 
 
 class M(Base):
+    __slots__ = ('isObject', 'size_deps')
+
     def __init__(self, size, isObject, taintID, *size_deps):
         Base.__init__(self, taintID)
         self.size = size
@@ -386,66 +647,352 @@ class M(Base):
     def Print(self, next, edges):
         if (self.isObject):
             print("{} [fillcolor=darkgoldenrod style=filled label=\"{{{{{}}} | {{<size>size = {} | t{} }}}}\"];" \
-                .format(self.Label(), self._bytes(), self.size, self.taintID))
+                .format(self.Label(), self._bytes(), self.size, self.taintID), file=self.graph.out)
         else:
             print("{} [fillcolor=darkorchid2 style=filled label=\"{{{{{}}} | {{<size>size = {} | t{} }}}}\"];" \
-                .format(self.Label(), self._bytes(), self.size, self.taintID))
+                .format(self.Label(), self._bytes(), self.size, self.taintID), file=self.graph.out)
 
         for dep in self.size_deps:
             next.add(dep)
             edges.add("{}:size -> {} [ label=\"t{}\" ];".format(self.Label(), dep.Label(), self.taintID))
 
 
-def PrintBlocks():
-    # Initialize blocks to be a dictionary of lists.
-    # Organize blocks based on their block number.
-    blocks = collections.defaultdict(list)
-    for b in B.BLOCKS:
-        blocks[b.nr].append(b)
-
-    if args.PRINT_METADATA:
-        for nr in blocks.keys():
-            if isDataBlock(nr):
-                data_blocks.add(nr)
-
-        # print(pointerList)
-        total_pointers = len(pointerSet)
-
-        # The total number of bytes marked as on-disk pointers must be
-        # a multiple of POINTER_SIZE. Otherwise, catch the error and print
-        # the current bytes marked as on-disk pointers.
-        res = total_pointers % POINTER_SIZE
-        if res != 0:
-            print("Total pointers: {}".format(total_pointers))
-            print("PointerSet: {}".format(sorted(pointerSet)))
-            assert(res == 0)
-
-        print("Total pointers: {}".format(total_pointers / POINTER_SIZE))
-        if args.VERBOSE:
-            # print "PointerSet: {}".format(sorted(pointerSet))
-            print("NameSet: {}".format(nameSet))
-            print("DataSet: {}".format(dataSet))
-            print("ValueSet: {}".format(valueSet))
-            print("DataSet per Block: {}".format(data_bytes_per_block))
-            print("DEntrySet per Block".format(name_bytes_per_block))
-            print("Blocks with directory entries: {}".format(sorted(directory_entry_blocks.keys())))
-            print("Datablocks: {}".format(sorted(data_blocks)))
-            print("{}".format(sorted(pointerSet)))
-
-    if args.PRINT_GRAPH:
-        print("digraph {")
-        print("node [shape=record];")
-        seen, nodes, edges = set(), set(), set()
+# The node classes a TraceGraph binds to itself. A trace line names them
+# (V, A, O, B, ...); only Select is made by the nodes themselves.
+NODE_CLASSES = (Select, V, A, O, B, NT, N, D, S, M)
+
+
+class TraceGraph(object):
+    """
+    Everything one run of head.py builds from a trace: the nodes, what they
+    tell about the disk (disk, pointerList and the block sets), and the
+    options and output stream of the run.
+
+    The trace builds its nodes with the classes of the graph, subclasses of
+    the node classes with graph set to it (graph.V, graph.B, ...; see
+    namespace). Graphs share nothing, so one process can analyze several
+    traces, one after another or in separate threads (see analyze).
+    """
+
+    def __init__(self, args, out=None):
+        self.args = args
+        self.out = sys.stdout if out is None else out
+
+        # Every B, in trace order (with --lazy, only their numbers).
+        self.blocks = []
+        self.block_numbers = set()
+
+        # Data types.
+        self.pointerList = collections.defaultdict(list)
+        self.disk = DiskBytes()
+
+        # Block types.
+        self.directory_entry_blocks = collections.defaultdict(list)
+        self.data_blocks = set()
+        self.name_bytes_per_block = collections.defaultdict(list)
+        self.data_bytes_per_block = collections.defaultdict(list)
+
+        # Pointer marking sweeps the graph backwards from the size and number
+        # taints of blocks (see markBlockPointers). A node has been visited
+        # by a sweep when its seen field holds the epoch of the sweep, so a
+        # new sweep only needs a new epoch instead of a pass resetting every
+        # node.
+        self.pointerEpoch = 1
+
+        # Set when traceFilter skips definitions whose taints are still read
+        # (see traceStub).
+        self.stubTaints = False
+
+        for cls in NODE_CLASSES:
+            setattr(self, cls.__name__, type(cls.__name__, (cls,), {'__slots__': (), 'graph': self}))
+
+    def namespace(self):
+        """
+        Returns the names a trace runs in: the node classes, t0, and the
+        traceFilter, traceStub and PrintBlocks hooks of interpret.py and
+        tail.py.
+        """
+        namespace = dict((cls.__name__, getattr(self, cls.__name__))
+                         for cls in NODE_CLASSES if cls is not Select)
+        namespace['t0'] = self.NT(0)
+        namespace['traceFilter'] = self.traceFilter
+        namespace['traceStub'] = self.traceStub
+        namespace['PrintBlocks'] = self.PrintBlocks
+        return namespace
+
+    def isDataBlock(self, block_number):
+        if self.args.DEBUG:
+            print("[DEBUG, {}]: Checking for data blocks, Block {} contains [{}, {}]".\
+                format(time.time(), block_number,
+                       len(self.name_bytes_per_block[block_number]),
+                       len(self.data_bytes_per_block[block_number])), file=self.out)
+
+        if len(self.name_bytes_per_block[block_number]) > 0:
+            return False
+        elif len(self.data_bytes_per_block[block_number]) > 0:
+            return True
+        else:
+            return False
+
+    def markBlockPointers(self, blocks, epoch=None):
+        """
+        Marks the on-disk pointers that the size and number taints of every
+        block in blocks were computed from, in one sweep over the graph:
+        every node is visited at most once, by the first block that reaches
+        it.
+
+        Each B marks its own pointers when it is created. To mark them again
+        from scratch, e.g. after clearing pointerList and the POINTER flags,
+        sweep blocks with a new epoch (newPointerEpoch()).
+        """
+        if epoch is None:
+            epoch = self.pointerEpoch
+        work = []
+        for b in blocks:
+            work.append(b.block_nr)
+            work.append(b.block_size)
+            while work:
+                node = work.pop()
+                if node.seen != epoch:
+                    node.markPointers(b.nr, work, epoch)
+
+    def newPointerEpoch(self):
+        self.pointerEpoch += 1
+        return self.pointerEpoch
+
+    def traceFilter(self, trace_file):
+        """
+        Called by interpret.py before it reads trace_file. Returns a function
+        telling whether line n of the trace has to be run, or None to run
+        every line.
+
+        With --lazy, only the B() records, the stores into blocks and the
+        definitions they are built from (see TraceIndex.blockInputs) are
+        run. The other definitions and stores are dropped as they stream
+        past, since neither pointer marking nor value tracking can see them.
+
+        With --graph, --blocks and a bounded --hops, only the lines the
+        printed neighborhood is built from are run (see neighborhoodFilter),
+        unless --metadata or --enum need the whole trace.
+        """
+        args = self.args
+        if args.LAZY:
+            return self.lazyFilter(loadTraceIndex(trace_file))
+        if (args.PRINT_GRAPH and args.BLOCKS is not None and args.HOPS >= 0 and
+                not (args.PRINT_METADATA or args.DETECT_ENUMS)):
+            return self.neighborhoodFilter(loadTraceIndex(trace_file))
+        return None
+
+    def lazyFilter(self, index):
+        from traceTokenizer import NO_TAINT, STORE
+
+        block_taints = set(index.defined[n] for n in index.blocks)
+        inputs = index.blockInputs()
+
+        def keep(n):
+            taint = index.defined[n]
+            if taint != NO_TAINT:
+                return taint < len(inputs) and inputs[taint] == 1
+            if index.kind(n) == STORE:
+                return index.lineTaints.get(n)[0] in block_taints
+            return True
+
+        return keep
+
+    def neighborhoodFilter(self, index):
+        """
+        Returns the lines PrintNeighborhood needs for --blocks and --hops.
+
+        The nodes it prints are the taints within --hops of the selected
+        blocks, following the edges the Print methods draw: to the operands
+        of a definition and to the sources of the stores into a node. Every
+        line mentioning one of them is run, since the reads size the node
+        and the stores give its byte sources. Their operands are only needed
+        to exist: their definitions are run, and the taints those read are
+        replaced by placeholders (see traceStub).
+        """
+        from traceTokenizer import COMMENT, NO_TAINT, scanTaints, tokenize
+
+        def isValue(t):
+            lines = index.defs.get(t, ())
+            return len(lines) > 0 and all(index.kind(n) == 'V' for n in lines)
+
+        def linked(t):
+            for n in index.defs.get(t, ()):
+                kind = index.kind(n)
+                if kind not in ('A', 'B', 'O'):
+                    for u in index.lineTaints.get(n, ()):
+                        if u != t:
+                            yield u
+                    continue
+                code = index.line(n).partition('#')[0]
+                arguments = code[code.find('(') + 1:code.rfind(')')].split(',')
+                if kind == 'O':
+                    # O(pointer, id, bytes...): only the bytes are drawn.
+                    arguments = arguments[2:]
+                for argument in arguments:
+                    argument = argument.strip()
+                    if (kind != 'O' and argument[:1] == 't' and argument[1:].isdigit() and
+                            isValue(int(argument[1:]))):
+                        # A and B print the value of a V operand instead of
+                        # an edge to it.
+                        continue
+                    for u in scanTaints(argument):
+                        yield u
+            for n in index.stores.get(t, ()):
+                for u in index.lineTaints.get(n)[1:]:
+                    yield u
+
+        hops = self.args.HOPS
+        printed = set()
+        for n in index.blocks:
+            record = tokenize(index.line(n))
+            # B(size, nr, tSize, tNr, id)
+            if record.kind == 'B' and record.literals[1] in self.args.BLOCKS:
+                printed.add(record.defined)
+        frontier = list(printed)
+        for hop in range(hops):
+            reached = []
+            for t in frontier:
+                for u in linked(t):
+                    if u not in printed:
+                        printed.add(u)
+                        reached.append(u)
+            frontier = reached
+
+        needed = set(printed)
+        for t in printed:
+            needed.update(index.deps.get(t, ()))
+            for n in index.stores.get(t, ()):
+                needed.update(index.lineTaints.get(n))
+        self.stubTaints = True
+
+        def keep(n):
+            taint = index.defined[n]
+            if taint != NO_TAINT and taint in needed:
+                return True
+            taints = index.lineTaints.get(n, ())
+            if not taints:
+                return index.kind(n) != COMMENT
+            return any(t in printed for t in taints)
+
+        return keep
+
+    def traceStub(self, name):
+        """
+        Called by interpret.py for a name the trace reads before defining
+        it. Once traceFilter skips definitions, a taint whose definition was
+        skipped is read as an NT node of the same id, which nothing prints.
+        Returns None for other names, which stay undefined.
+        """
+        if self.stubTaints and name[0] == 't' and name[1:].isdigit():
+            return self.NT(int(name[1:]))
+        return None
 
+    def PrintCoarseGraph(self, blocks):
+        """
+        Prints the graph aggregated to one node per block number and one node
+        per source object (the node a block's bytes were stored from), in one
+        pass over the blocks' byte sources and pointerList. Like the
+        byte-level graph, edges point from a block to where its data came
+        from:
+
+            block -> block   bytes copied from the other block, or (dashed)
+                             the pointer bytes the block number was computed
+                             from
+            block -> object  bytes stored from that object (V, A, O, D, ...)
+
+        A kind with more than --coarse-objects objects gets one node for all
+        of them instead. Edges are labeled with the number of bytes and of
+        distinct taints.
+        """
+        # (block number, source) => [bytes, taint IDs], where a source is a
+        # block number or a (kind, taint ID) object
+        sources = collections.defaultdict(lambda: [0, set()])
         for nr, bs in blocks.items():
-            # nr = block number (the key of the dictionary)
-            # bs = list of blocks
+            for b in bs:
+                for s in b.byte_sources.values():
+                    node = s.parent if isinstance(s, Select) else s
+                    if node.getName() == 'B':
+                        source = node.nr
+                    else:
+                        source = (node.getName(), node.taintID)
+                    edge = sources[(nr, source)]
+                    edge[0] += 1
+                    edge[1].add(s.taintID)
+
+        objects = collections.defaultdict(set)
+        for _, source in sources:
+            if isinstance(source, tuple):
+                objects[source[0]].add(source[1])
+        merged = set(kind for kind, taints in objects.items() if len(taints) > self.args.COARSE_OBJECTS)
+
+        # DOT node => label of the object nodes, and the edges by DOT node
+        labels = {}
+        edges = collections.defaultdict(lambda: [0, set()])
+        for (nr, source), (count, taints) in sources.items():
+            if not isinstance(source, tuple):
+                target = "block{}".format(source)
+            elif source[0] in merged:
+                target = "kind{}".format(source[0])
+                labels[target] = "{} ({} objects)".format(source[0], len(objects[source[0]]))
+            else:
+                target = "{}t{}".format(*source)
+                labels[target] = "{} t{}".format(*source)
+            edge = edges[(nr, target)]
+            edge[0] += count
+            edge[1] |= taints
+
+        # (block number, block holding the pointer) => pointer bytes
+        pointers = collections.Counter()
+        for nr, offsets in self.pointerList.items():
+            for offset in set(offsets):
+                pointers[(nr, offset // BLOCK_SIZE)] += 1
+
+        print("digraph {", file=self.out)
+        print("node [shape=box];", file=self.out)
+        for nr in sorted(set(blocks) | set(nr for _, nr in pointers)):
+            print("block{} [label=\"block {}\\n{} reads\"];".format(nr, nr, len(blocks.get(nr, ()))), file=self.out)
+        for target, label in sorted(labels.items()):
+            print("{} [shape=ellipse label=\"{}\"];".format(target, label), file=self.out)
+        for (nr, target), (count, taints) in sorted(edges.items()):
+            print("block{} -> {} [ label=\"{} B, {} t\" ];".format(nr, target, count, len(taints)), file=self.out)
+        for (nr, holder), count in sorted(pointers.items()):
+            print("block{} -> block{} [ style=dashed label=\"{} B ptr\" ];".format(nr, holder, count), file=self.out)
+        print("}", file=self.out)
+
+    def PrintNeighborhood(self, blocks, block_numbers, hops):
+        """
+        Prints the part of the graph within hops edges of the blocks numbered
+        block_numbers, visiting it breadth first and printing every node and its
+        edges as it is reached, instead of walking the whole graph. Nodes at the
+        last hop are printed without their outgoing edges. A negative hops
+        prints everything reachable from the blocks.
+        """
+        print("digraph {", file=self.out)
+        print("node [shape=record];", file=self.out)
+        seen = set()
+        queue = collections.deque()
+
+        def expand(nodes, edges, hop):
+            if 0 <= hops <= hop:
+                return
+            for edge in edges:
+                print(edge, file=self.out)
+            for node in nodes:
+                if node not in seen:
+                    seen.add(node)
+                    # A Select is printed as a port of the node it selects from,
+                    # so reaching it does not count as a hop.
+                    queue.append((node, hop if isinstance(node, Select) else hop + 1))
+
+        for nr in sorted(block_numbers):
+            bs = blocks.get(nr, ())
+            nodes, edges = set(), set()
 
             if 1 < len(bs):
-                # By denoting subgraph as a cluster, the entire drawing of the
-                # cluster will be contained within a bounding rectangle.
-                print("subgraph cluster{} {{".format(nr))
-                print("rankdir=TB;")  # Graph will be laid out from top to bottom.
+                print("subgraph cluster{} {{".format(nr), file=self.out)
+                print("rankdir=TB;", file=self.out)  # Graph will be laid out from top to bottom.
 
             for b in bs:
                 seen.add(b)  # Mark block as "seen".
@@ -453,59 +1000,171 @@ def PrintBlocks():
                 b.PrintByteSources(nodes, edges)
 
             if 1 < len(bs):
-                print("}")
-
-        while nodes:
-            node = nodes.pop()
-            if node not in seen:
-                seen.add(node)  # Mark block as "seen" in order not to process it.
-                node.Print(nodes, edges)
-                node.PrintByteSources(nodes, edges)
-
-        for edge in edges:
-            print(edge)
-
-        print("}")
-
-    if args.DETECT_ENUMS:
-        blockDPMap = dict()
-        with open('testfs_output.dat', 'r') as file:
-            blockDPMap = json.load(file)
-
-        # Verify that the input data is correct.
-        for block in blockDPMap:
-            assert(len(blockDPMap[block]) == BLOCK_SIZE)
-
-        inode_blocks = []
-        for i in range(64, 192):
-            inode_blocks.append(str(i))
-
-        for block_number in inode_blocks:
-            if block_number in blockDPMap:
-                block_types = blockDPMap[block_number]
-                for i in range(0, BLOCK_SIZE):
-                    if block_types[i] == 'D':
-                        offset = int(block_number) * BLOCK_SIZE + i
-                        if offset in valueSet:
-                            block_types[i] = valueSet[offset]
-
-        for offset in pointerSet:
-            block_number = str(offset / BLOCK_SIZE)
-            block_byte = offset % BLOCK_SIZE
-
-            if block_number not in blockDPMap:
-                print("[ERROR, {}]: Block {} is not stored in blockDPMap.".format(time.time(), block_number))
-                sys.exit(-1)
-            else:
-                block_types = blockDPMap[block_number]
-                if block_types[block_byte] != 'P':
-                    block_types[block_byte] = 'P'
-                    print("[INFO, {}]: Byte {} inside block {} was not marked as part of a pointer."
-                          .format(time.time(), block_byte, block_number))
-
-        for block_number in inode_blocks:
-            if block_number in blockDPMap:
-                print('\n------------------------------\nBlock {}:\n{} //\n{}\n------------------------------'
-                      .format(block_number, blockDPMap[block_number][:32], blockDPMap[block_number][32:]))
-
-t0 = NT(0)
+                print("}", file=self.out)
+
+            # Edges are printed outside of the cluster, which would otherwise
+            # pull their targets into it.
+            expand(nodes, edges, 0)
+
+        while queue:
+            node, hop = queue.popleft()
+            nodes, edges = set(), set()
+            node.Print(nodes, edges)
+            node.PrintByteSources(nodes, edges)
+            expand(nodes, edges, hop)
+
+        print("}", file=self.out)
+
+    def PrintBlocks(self):
+        # Initialize blocks to be a dictionary of lists.
+        # Organize blocks based on their block number.
+        blocks = collections.defaultdict(list)
+        for b in self.blocks:
+            blocks[b.nr].append(b)
+        if self.args.LAZY:
+            # Only the block numbers are kept.
+            for nr in self.block_numbers:
+                blocks[nr] = []
+
+        if self.args.PRINT_METADATA:
+            for nr in blocks.keys():
+                if self.isDataBlock(nr):
+                    self.data_blocks.add(nr)
+
+            # print(pointerList)
+            total_pointers = self.disk.count(POINTER)
+
+            # The total number of bytes marked as on-disk pointers must be
+            # a multiple of POINTER_SIZE. Otherwise, catch the error and print
+            # the current bytes marked as on-disk pointers.
+            res = total_pointers % POINTER_SIZE
+            if res != 0:
+                print("Total pointers: {}".format(total_pointers), file=self.out)
+                print("PointerSet: {}".format(self.disk.offsets(POINTER).tolist()), file=self.out)
+                assert(res == 0)
+
+            print("Total pointers: {}".format(total_pointers / POINTER_SIZE), file=self.out)
+            if self.args.VERBOSE:
+                # print "PointerSet: {}".format(self.disk.offsets(POINTER).tolist())
+                print("NameSet: {}".format(self.disk.offsets(NAME).tolist()), file=self.out)
+                print("DataSet: {}".format(self.disk.offsets(DATA).tolist()), file=self.out)
+                print("ValueSet: {}".format(self.disk.formatValues()), file=self.out)
+                print("DataSet per Block: {}".format(self.data_bytes_per_block), file=self.out)
+                print("DEntrySet per Block".format(self.name_bytes_per_block), file=self.out)
+                print("Blocks with directory entries: {}".format(sorted(self.directory_entry_blocks.keys())), file=self.out)
+                print("Datablocks: {}".format(sorted(self.data_blocks)), file=self.out)
+                print("{}".format(self.disk.offsets(POINTER).tolist()), file=self.out)
+
+        if self.args.PRINT_GRAPH and self.args.BLOCKS is not None:
+            self.PrintNeighborhood(blocks, self.args.BLOCKS, self.args.HOPS)
+        elif self.args.PRINT_GRAPH:
+            print("digraph {", file=self.out)
+            print("node [shape=record];", file=self.out)
+            seen, nodes, edges = set(), set(), set()
+
+            for nr, bs in blocks.items():
+                # nr = block number (the key of the dictionary)
+                # bs = list of blocks
+
+                if 1 < len(bs):
+                    # By denoting subgraph as a cluster, the entire drawing of the
+                    # cluster will be contained within a bounding rectangle.
+                    print("subgraph cluster{} {{".format(nr), file=self.out)
+                    print("rankdir=TB;", file=self.out)  # Graph will be laid out from top to bottom.
+
+                for b in bs:
+                    seen.add(b)  # Mark block as "seen".
+                    b.Print(nodes, edges)
+                    b.PrintByteSources(nodes, edges)
+
+                if 1 < len(bs):
+                    print("}", file=self.out)
+
+            while nodes:
+                node = nodes.pop()
+                if node not in seen:
+                    seen.add(node)  # Mark block as "seen" in order not to process it.
+                    node.Print(nodes, edges)
+                    node.PrintByteSources(nodes, edges)
+
+            for edge in edges:
+                print(edge, file=self.out)
+
+            print("}", file=self.out)
+
+        if self.args.COARSE_GRAPH:
+            self.PrintCoarseGraph(blocks)
+
+        if self.args.DETECT_ENUMS:
+            self.DetectEnums()
+
+    def DetectEnums(self):
+        """
+        Checks the block types of --enum-types against the trace: every byte
+        marked as part of a pointer must have type 'P', and the data bytes
+        ('D') whose value is known are replaced by it in the blocks of
+        --enum-blocks, which are then printed.
+        """
+        types = loadBlockTypes(self.args.ENUM_TYPES)
+        stored = (types != NO_TYPE).any(axis=1)
+
+        pointers = self.disk.offsets(POINTER)
+        block_numbers = pointers // BLOCK_SIZE
+        block_bytes = pointers % BLOCK_SIZE
+        # Every pointer byte must be in a block with types. Those before the
+        # first one that is not are still reconciled, as they were when the
+        # pointers were checked one at a time.
+        known = block_numbers < len(types)
+        known[known] = stored[block_numbers[known]]
+        missing = np.flatnonzero(~known)
+        end = missing[0] if len(missing) else len(pointers)
+        block_numbers, block_bytes = block_numbers[:end], block_bytes[:end]
+
+        unmarked = np.flatnonzero(types[block_numbers, block_bytes] != 'P')
+        types[block_numbers, block_bytes] = 'P'
+        for i in unmarked:
+            print("[INFO, {}]: Byte {} inside block {} was not marked as part of a pointer."
+                  .format(time.time(), block_bytes[i], block_numbers[i]), file=self.out)
+        if len(missing):
+            raise BlockTypesError("Block {} is not stored in blockDPMap.".format(pointers[end] // BLOCK_SIZE))
+
+        blocks = np.array(sorted(self.args.ENUM_BLOCKS), np.int64)
+        blocks = blocks[blocks < len(types)]
+        blocks = blocks[stored[blocks]]
+        offsets = blocks[:, np.newaxis] * BLOCK_SIZE + np.arange(BLOCK_SIZE)
+        flags, values = self.disk.lookup(offsets)
+        replaced = ((flags & VALUE) != 0) & (types[blocks] == 'D')
+
+        for i, block_number in enumerate(blocks):
+            block_types = [t.decode('ascii') for t in types[block_number].tolist()]
+            for j in np.flatnonzero(replaced[i]):
+                block_types[j] = self.disk.objects.get(int(offsets[i, j]), int(values[i, j]))
+            print('\n------------------------------\nBlock {}:\n{} //\n{}\n------------------------------'
+                  .format(block_number, block_types[:32], block_types[32:]), file=self.out)
+
+
+def analyze(trace_file, argv=(), out=None):
+    """
+    Runs trace_file through a new TraceGraph with the head arguments argv,
+    like interpret.py head.py <trace> tail.py -- <argv> does in a process
+    of its own, and prints to out (default: stdout). Returns the graph.
+    Raises BlockTypesError where that process would exit (see DetectEnums).
+    """
+    graph = TraceGraph(parseArgs(list(argv)), out)
+    runTrace(graph.namespace(), trace_file)
+    graph.PrintBlocks()
+    return graph
+
+
+if __name__ == '__main__':
+    # Run by interpret.py: the trace runs in the globals of this module.
+    graph = TraceGraph(parseArgs())
+    globals().update(graph.namespace())
+
+    def PrintBlocks():
+        # Called by tail.py. Unlike analyze, a failed check ends the process.
+        try:
+            graph.PrintBlocks()
+        except BlockTypesError as e:
+            print("[ERROR, {}]: {}".format(time.time(), e), file=graph.out)
+            sys.exit(-1)
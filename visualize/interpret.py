@@ -0,0 +1,263 @@
+"""
+Streams a taint trace through a head script instead of exec'ing the
+concatenation of head, trace and tail.
+
+The trace printed by the runtime is a sequence of Python statements:
+
+    t7=V(64, 7) # Taint<7, 0, 0>
+    t9=A("add",t1,t1, 9)
+    t10=B(64,0,t7,t9, 10) # GetBlock(64, 0) r
+    t45=O(t10,45,t10[8],t10[9]) # Load(27047064, 4)
+    t12[3]=t9[0] # Store::is_obj equals true.
+    ICMP(t3,t4,'ICMP_ULE')
+
+Compiling a multi-million-line trace as one module costs far more memory
+than the graph it builds. Here the head script is run once as __main__, and
+every trace line is parsed and dispatched to the constructors it defined
+(V, A, O, B, M, N, D, S, ...), with "tN[i]=x" going through __setitem__.
+Taints live in the module namespace, exactly as they did in the concatenated
+script, so only the graph itself is kept in memory. Lines that are not of
+one of the forms above are compiled and executed on their own. Traces written
+compressed by the runtime (FSLICE_COMPRESSED_TRACE) are read frame by frame.
+
+A head script that defines traceFilter(trace_file) is asked for a predicate
+over line numbers before the trace is read; lines for which it returns False
+are skipped (see head.py --lazy and --blocks). If it also defines
+traceStub(name), a name used before it is defined (a taint whose definition
+was skipped) is bound to what traceStub returns instead of failing, unless
+that is None. runTrace feeds a trace to any namespace, which lets
+head.analyze run many traces in one process.
+
+Usage:
+    python interpret.py <head.py> <trace> [<tail.py>] [-- <head arguments>]
+"""
+
+import os
+import sys
+import types
+
+# compressedTrace lives in post_processing/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'post_processing'))
+from compressedTrace import openTrace
+
+try:
+    intern
+except NameError:
+    from sys import intern
+
+
+NAME, SELECT, CONST = range(3)
+
+CONSTANTS = {'True': True, 'False': False, 'None': None}
+
+
+def isName(token):
+    return token.replace('_', 'a').isalnum() and not token[0].isdigit()
+
+
+def parseValue(token):
+    """
+    Parses a single argument: tN, tN[i], an integer or a quoted string.
+    Returns a (kind, payload) pair; raises SyntaxError for anything else.
+    """
+    token = token.strip()
+    if not token:
+        raise SyntaxError(token)
+    first = token[0]
+    if first == '"' or first == "'":
+        if len(token) < 2 or token[-1] != first:
+            raise SyntaxError(token)
+        # Interned like a compiled literal: the heads compare ops with 'is'.
+        return CONST, intern(token[1:-1])
+    if first.isdigit() or first == '-':
+        try:
+            return CONST, int(token)
+        except ValueError:
+            raise SyntaxError(token)
+    bracket = token.find('[')
+    if bracket != -1:
+        name, index = token[:bracket], token[bracket + 1:-1]
+        if token[-1] != ']' or not isName(name) or not index.isdigit():
+            raise SyntaxError(token)
+        return SELECT, (name, int(index))
+    if token in CONSTANTS:
+        return CONST, CONSTANTS[token]
+    if not isName(token):
+        raise SyntaxError(token)
+    return NAME, token
+
+
+def parseExpression(expr):
+    """
+    Parses "F(arg, ...)" into (F, [args]) and anything else into
+    (None, value).
+    """
+    if not expr.endswith(')'):
+        return None, parseValue(expr)
+    paren = expr.find('(')
+    func = expr[:paren].strip()
+    if paren <= 0 or not isName(func):
+        raise SyntaxError(expr)
+    inner = expr[paren + 1:-1]
+    if not inner.strip():
+        return func, []
+    return func, [parseValue(arg) for arg in inner.split(',')]
+
+
+def parseStatement(code):
+    """
+    Parses one line of code into (target, expression). target is None for a
+    bare call, a name, or a (name, index) pair for a store.
+    """
+    equal = code.find('=')
+    if equal == -1:
+        return None, parseExpression(code)
+    if code[equal + 1:equal + 2] == '=':
+        raise SyntaxError(code)
+
+    target = code[:equal].strip()
+    kind, payload = parseValue(target)
+    if kind == CONST:
+        raise SyntaxError(code)
+    return payload, parseExpression(code[equal + 1:].strip())
+
+
+class Interpreter(object):
+    def __init__(self, namespace):
+        self.namespace = namespace
+
+    def lookup(self, name):
+        try:
+            return self.namespace[name]
+        except KeyError:
+            stub = self.namespace.get('traceStub')
+            value = stub(name) if callable(stub) else None
+            if value is None:
+                raise NameError("name '{0}' is not defined".format(name))
+            self.namespace[name] = value
+            return value
+
+    def value(self, parsed):
+        kind, payload = parsed
+        if kind == CONST:
+            return payload
+        if kind == NAME:
+            return self.lookup(payload)
+        name, index = payload
+        return self.lookup(name)[index]
+
+    def execute(self, line):
+        """
+        Executes one trace line.
+        """
+        code = stripComment(line)
+        if not code:
+            return
+        try:
+            target, (func, args) = parseStatement(code)
+        except SyntaxError:
+            exec(compile(line, '<trace>', 'exec'), self.namespace)
+            return
+
+        if func is None:
+            value = self.value(args)
+        else:
+            value = self.lookup(func)(*[self.value(arg) for arg in args])
+
+        if target is None:
+            return
+        if isinstance(target, tuple):
+            name, index = target
+            self.lookup(name)[index] = value
+        else:
+            self.namespace[target] = value
+
+    def run(self, lines, keep=None):
+        """
+        Executes every line, or with keep, only the lines n for which
+        keep(n) is true.
+        """
+        if keep is None:
+            for line in lines:
+                self.execute(line)
+        else:
+            for n, line in enumerate(lines):
+                if keep(n):
+                    self.execute(line)
+
+
+def stripComment(line):
+    """
+    Returns the code part of a trace line, or '' for blank and comment lines.
+    A '#' inside a quoted string is not a comment; such lines are returned
+    whole and end up in the exec fallback.
+    """
+    line = line.strip()
+    if not line or line[0] == '#':
+        return ''
+    pound = line.find('#')
+    if pound == -1:
+        return line
+    code = line[:pound]
+    if code.count('"') % 2 or code.count("'") % 2:
+        return line
+    return code.rstrip()
+
+
+def runScript(path, namespace):
+    with open(path) as f:
+        source = f.read()
+    exec(compile(source, path, 'exec'), namespace)
+
+
+def runTrace(namespace, trace):
+    """
+    Feeds trace line by line to the constructors in namespace, skipping the
+    lines rejected by its traceFilter, if it has one.
+    """
+    keep = None
+    if callable(namespace.get('traceFilter')):
+        keep = namespace['traceFilter'](trace)
+    with openTrace(trace) as f:
+        Interpreter(namespace).run(f, keep)
+
+
+def interpret(head, trace, tail=None, argv=()):
+    """
+    Runs head as __main__ with argv, feeds it the trace line by line and then
+    runs tail in the same namespace. Returns the namespace.
+    """
+    module = types.ModuleType('__main__')
+    module.__file__ = head
+    namespace = module.__dict__
+
+    saved_main = sys.modules.get('__main__')
+    saved_argv = sys.argv
+    sys.modules['__main__'] = module
+    sys.argv = [head] + list(argv)
+    try:
+        runScript(head, namespace)
+        runTrace(namespace, trace)
+        if tail:
+            runScript(tail, namespace)
+    finally:
+        sys.modules['__main__'] = saved_main
+        sys.argv = saved_argv
+    return namespace
+
+
+def main():
+    argv = sys.argv[1:]
+    head_args = []
+    if '--' in argv:
+        split = argv.index('--')
+        argv, head_args = argv[:split], argv[split + 1:]
+    if len(argv) not in (2, 3):
+        sys.stderr.write("Usage: {0} <head.py> <trace> [<tail.py>] [-- <head arguments>]\n"
+                         .format(sys.argv[0]))
+        sys.exit(-1)
+    interpret(argv[0], argv[1], argv[2] if len(argv) == 3 else None, head_args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/python
+"""
+Reader for the binary trace written by the runtime when FSLICE_BINARY_TRACE
+is set (see BinaryRecord in runtime/FSlice.cpp).
+
+The trace is three files:
+
+    <file>      fixed-width 32-byte records, one per V/A/O/B/M/N/D/S/ICMP
+                definition or store
+    <file>.ops  (id, offset) uint32 pairs, the operands of O and M records in
+                record order; record i owns nops[i] of them
+    <file>.str  operator and ICMP predicate names, one per line, indexed by
+                the flag byte of A and ICMP records
+
+The records are loaded as a NumPy structured array, so selecting e.g. all
+B() records or all ids defined by an A() is a column operation instead of a
+regex over text. render() turns records back into the text lines that the
+existing tools read:
+
+    python binaryTrace.py /tmp/testfs.bin > /tmp/testfs.py
+
+Comment lines such as #gBlockTAINT are still printed by the runtime on stderr
+and are not part of the binary trace; #SWITCH suffixes are kept in the A
+records.
+"""
+
+import sys
+
+import numpy as np
+
+RECORD_DTYPE = np.dtype([
+    ('kind', 'u1'),
+    ('flag', 'u1'),
+    ('nops', '<u2'),
+    ('id', '<u4'),
+    ('a', '<u4'),
+    ('b', '<u4'),
+    ('x', '<u8'),
+    ('y', '<u8'),
+])
+
+OPERAND_DTYPE = np.dtype([
+    ('id', '<u4'),
+    ('offset', '<u4'),
+])
+
+ICMP = 'I'
+STORE = 's'
+
+# Comment printed after a store, keyed by the flag byte of the record.
+STORE_COMMENTS = {
+    'o': ' # Store::is_obj equals true.',
+    'd': '',
+    'm': ' # fslice_memmove',
+    'w': '# fslice_write_block',
+}
+
+
+class BinaryTrace(object):
+    """
+    A binary trace loaded as NumPy arrays.
+
+    records  structured array of RECORD_DTYPE
+    operands structured array of OPERAND_DTYPE
+    opStart  index of the first operand of every record
+    names    operator / predicate names, indexed by records['flag']
+    """
+
+    def __init__(self, trace_file, mmap=True):
+        self.trace_file = trace_file
+        if mmap:
+            self.records = np.memmap(trace_file, dtype=RECORD_DTYPE, mode='r')
+        else:
+            self.records = np.fromfile(trace_file, dtype=RECORD_DTYPE)
+        self.operands = np.fromfile(trace_file + '.ops', dtype=OPERAND_DTYPE)
+        with open(trace_file + '.str') as f:
+            self.names = [line.rstrip('\n') for line in f]
+
+        nops = self.records['nops'].astype(np.int64)
+        self.opStart = np.zeros(len(nops) + 1, dtype=np.int64)
+        np.cumsum(nops, out=self.opStart[1:])
+
+    def __len__(self):
+        return len(self.records)
+
+    def ofKind(self, kind):
+        """
+        Returns the record numbers of the given kind ('B', 'V', 's', ...).
+        """
+        return np.flatnonzero(self.records['kind'] == ord(kind))
+
+    def operandsOf(self, n):
+        """
+        Returns the operands of record n as a structured array.
+        """
+        return self.operands[self.opStart[n]:self.opStart[n + 1]]
+
+    def name(self, n):
+        return self.names[self.records['flag'][n]]
+
+    def render(self, n):
+        """
+        Returns record n in the text format printed by the runtime.
+        """
+        r = self.records[n]
+        kind = chr(r['kind'])
+        tid = int(r['id'])
+        if kind == 'V':
+            return "t{0}=V({1}, {0}) # Taint<{0}, 0, 0>".format(tid, int(r['x']))
+        if kind == 'A':
+            line = 't{0}=A("{1}",t{2},t{3}, {0})'.format(
+                tid, self.name(n), int(r['a']), int(r['b']))
+            if r['x']:
+                line += "#SWITCH {0} {1}".format(int(r['x']), int(r['y']))
+            return line
+        if kind == 'O':
+            ops = ''.join(",t{0}".format(int(i)) for i in self.operandsOf(n)['id'])
+            return "t{0}=O(t{1},{0}{2}) # Load({3}, {4})".format(
+                tid, int(r['a']), ops, int(r['x']), int(r['y']))
+        if kind == 'B':
+            return "t{0}=B({1},{2},t{3},t{4}, {0}) # GetBlock({1}, {2}) {5}".format(
+                tid, int(r['x']), int(r['y']), int(r['a']), int(r['b']),
+                chr(r['flag']))
+        if kind == 'M':
+            ops = ''.join(",t{0}".format(int(i)) for i in self.operandsOf(n)['id'])
+            return "t{0}=M({1}, {2}, {0}{3})".format(
+                tid, int(r['x']), int(r['flag']), ops)
+        if kind in 'NDS':
+            return "t{0}={1}({2}, {0})".format(tid, kind, int(r['x']))
+        if kind == ICMP:
+            return "ICMP(t{0},t{1},'{2}')".format(
+                int(r['a']), int(r['b']), self.name(n))
+        if kind == STORE:
+            flag = chr(r['flag'])
+            src = "t{0}".format(int(r['a']))
+            if flag in 'od':
+                src += "[{0}]".format(int(r['y']))
+            return "t{0}[{1}]={2}{3}".format(
+                tid, int(r['x']), src, STORE_COMMENTS[flag])
+        raise ValueError("unknown record kind {0!r} at {1}".format(kind, n))
+
+    def lines(self):
+        for n in range(len(self.records)):
+            yield self.render(n)
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.stderr.write("usage: {0} <binary trace>\n".format(sys.argv[0]))
+        sys.exit(1)
+    trace = BinaryTrace(sys.argv[1])
+    out = sys.stdout
+    for line in trace.lines():
+        out.write(line)
+        out.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,13 @@
 
 import argparse
 from collections import defaultdict
+import os
 import re
+import sys
+
+# traceIndex lives in post_processing/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from traceIndex import getTraceIndex, taintId
 
 BLOCK_SIZE = 64
 blockContents = defaultdict(list)
@@ -51,38 +57,46 @@ def evaluateWritePath(traceFile, writeTaint, prevReadTaint, blockNumber, zeroCon
     global blockIntervalSet
     global blockAllocationCountSet
 
-    with open(traceFile, 'r') as f:
-        input_lines = f.readlines()
-        # print writeTaint
-        count = 0
-        offsets = defaultdict(list)
-        offset = -1
-        continuous_writes = False
-        for line in input_lines:
-            if (writeTaint + '[') in line:
-                continuous_writes = True
-                # print(writeTaint, line)
-                offset = int(line.split('[')[1].split(']')[0])
-                leftTaint = line.split('=')[0].split('[')[0]
-                rightTaint = line.split('=')[1].split('[')[0]
-
-                if rightTaint == zeroConstantTaint: # assigning zero
-                    blockContents[int(offset)] = 'Z'
-                elif prevReadTaint is None:
-                    blockContents[int(offset)] = rightTaint 
-                    count+=1
-                    offsets[int(blockNumber)].append(offset)
-                elif rightTaint != prevReadTaint:
-                    blockContents[int(offset)] = rightTaint
-                    count+=1
-                    offsets[int(blockNumber)].append(offset)
-            else:
-                if continuous_writes == True:
-                    blockAllocationCountSet[blockNumber].append(str(count))
-                    #print blockAllocationCountSet[blockNumber]
-                    if len(offsets[int(blockNumber)]) != 0:
-                        blockIntervalSet[blockNumber].extend(getSection(offsets[int(blockNumber)]))
-                continuous_writes = False
+    index = getTraceIndex(traceFile)
+    # print writeTaint
+    count = 0
+    offsets = defaultdict(list)
+    offset = -1
+    prev = None
+
+    def endOfWrites():
+        blockAllocationCountSet[blockNumber].append(str(count))
+        #print blockAllocationCountSet[blockNumber]
+        if len(offsets[int(blockNumber)]) != 0:
+            blockIntervalSet[blockNumber].extend(getSection(offsets[int(blockNumber)]))
+
+    # Only lines mentioning writeTaint can match; any other line in between
+    # ends a run of continuous writes.
+    for n in index.uses.get(taintId(writeTaint), ()):
+        line = index.line(n)
+        if (writeTaint + '[') not in line:
+            continue
+        if prev is not None and n != prev + 1:
+            endOfWrites()
+        prev = n
+        # print(writeTaint, line)
+        offset = int(line.split('[')[1].split(']')[0])
+        leftTaint = line.split('=')[0].split('[')[0]
+        rightTaint = line.split('=')[1].split('[')[0]
+
+        if rightTaint == zeroConstantTaint: # assigning zero
+            blockContents[int(offset)] = 'Z'
+        elif prevReadTaint is None:
+            blockContents[int(offset)] = rightTaint 
+            count+=1
+            offsets[int(blockNumber)].append(offset)
+        elif rightTaint != prevReadTaint:
+            blockContents[int(offset)] = rightTaint
+            count+=1
+            offsets[int(blockNumber)].append(offset)
+
+    if prev is not None and prev + 1 < len(index):
+        endOfWrites()
     # block contents contains the new taints assigned to it. We need a count on individual
     # new taints assigned to each block. each new bunch of taints (except 'Z') corresponds
     # to a new structure
@@ -132,14 +146,12 @@ def blockTaintAndOffset(traceFile):
     blockTaintDict = defaultdict(list)
     zeroConstantTaint = None
 
-    block_lines = []
-    with open(traceFile, 'r') as f:
-        input_lines = f.readlines()
-        for line in input_lines:
-            if 'B(' in line:
-                block_lines.append(line)
-            elif 'V(0' in line:
-                zeroConstantTaint = re.findall(r'(t\d+)=', line)[0]
+    index = getTraceIndex(traceFile)
+    block_lines = [index.line(n) for n in index.blocks]
+    for n in index.linesOfKind('V'):
+        line = index.line(n)
+        if 'V(0' in line:
+            zeroConstantTaint = re.findall(r'(t\d+)=', line)[0]
 
     assert zeroConstantTaint
 
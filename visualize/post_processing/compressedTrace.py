@@ -0,0 +1,332 @@
+#!/usr/bin/python
+"""
+Transparent access to compressed taint traces.
+
+When FSLICE_COMPRESSED_TRACE names a file, the runtime writes the trace there
+as a sequence of gzip members ("frames") of about 1 MiB of whole lines each,
+and appends the compressed and uncompressed start offset of every frame to
+<file>.frames (see CompressedTrace in runtime/FSlice.cpp). zcat reads such a
+trace like any gzip file.
+
+openTrace() and mapTrace() return the same interface for plain and compressed
+traces, so TraceIndex, TraceReader and interpret.py read both. Offsets are
+always offsets into the uncompressed text. The frame index lets a reader
+decompress only the frames holding the lines it asks for, which keeps random
+access and reverse iteration cheap. A gzip file without <file>.frames (e.g.
+written by gzip) is scanned once and its frame index saved next to it.
+
+    python compressedTrace.py /tmp/testfs.py.gz > /tmp/testfs.py
+"""
+
+import bisect
+import mmap
+import os
+import struct
+import sys
+import zlib
+from collections import OrderedDict
+
+GZIP_MAGIC = '\x1f\x8b'
+FRAMES_SUFFIX = '.frames'
+# Two uint64_t per frame: compressed offset, uncompressed offset.
+FRAME_ENTRY = '<QQ'
+# Number of decompressed frames kept by CompressedTrace.
+CACHED_FRAMES = 4
+READ_CHUNK = 1 << 20
+
+
+def isCompressed(trace_file):
+    with open(trace_file, 'rb') as f:
+        return f.read(len(GZIP_MAGIC)) == GZIP_MAGIC
+
+
+def _decompressor():
+    # 16 + MAX_WBITS: expect a gzip header and trailer.
+    return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+
+def scanFrames(trace_file):
+    """
+    Returns the (compressed, uncompressed) start offsets of every gzip member
+    of trace_file, decompressing it once.
+    """
+    frames = [(0, 0)]
+    uncompressed = 0
+    with open(trace_file, 'rb') as f:
+        base = 0
+        data = f.read(READ_CHUNK)
+        d = _decompressor()
+        while data:
+            uncompressed += len(d.decompress(data))
+            rest = d.unused_data
+            if rest:
+                # The member ended inside data; the next one starts at rest.
+                base += len(data) - len(rest)
+                frames.append((base, uncompressed))
+                d = _decompressor()
+                data = rest
+            else:
+                base += len(data)
+                data = f.read(READ_CHUNK)
+    return frames
+
+
+def readFrames(trace_file):
+    """
+    Returns the frame index of trace_file, from <trace_file>.frames when the
+    runtime wrote one and by scanning the trace (then saving it) otherwise.
+    """
+    frames_file = trace_file + FRAMES_SUFFIX
+    try:
+        with open(frames_file, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        data = None
+    if data is not None:
+        # Empty while the runtime has not finished its first frame.
+        size = struct.calcsize(FRAME_ENTRY)
+        return [struct.unpack_from(FRAME_ENTRY, data, i)
+                for i in xrange(0, len(data) - len(data) % size, size)]
+
+    frames = scanFrames(trace_file)
+    try:
+        with open(frames_file, 'wb') as f:
+            for entry in frames:
+                f.write(struct.pack(FRAME_ENTRY, *entry))
+    except (IOError, OSError) as e:
+        sys.stderr.write("[WARN]: Could not save frame index {}: {}\n".format(frames_file, e))
+    return frames
+
+
+class CompressedTrace(object):
+    """
+    The uncompressed text of a compressed trace, as a read-only buffer that
+    supports what TraceReader uses of an mmap: len(), slicing, find() and
+    rfind(). Frames are decompressed on demand and the last CACHED_FRAMES are
+    kept.
+    """
+
+    def __init__(self, trace_file):
+        self.trace_file = trace_file
+        self._file = open(trace_file, 'rb')
+        frames = readFrames(trace_file)
+        self._compressed = [c for c, _ in frames]
+        self._starts = [u for _, u in frames]
+        self._cache = OrderedDict()
+        # Only the frames listed are complete while the trace is written, so
+        # the size is where the last of them ends.
+        self._size = 0
+        if frames:
+            self._size = self._starts[-1] + len(self.frame(len(frames) - 1))
+
+    def __len__(self):
+        return self._size
+
+    def frame(self, i):
+        """
+        Returns the decompressed text of frame i.
+        """
+        text = self._cache.pop(i, None)
+        if text is None:
+            self._file.seek(self._compressed[i])
+            if i + 1 < len(self._compressed):
+                data = self._file.read(self._compressed[i + 1] - self._compressed[i])
+                text = _decompressor().decompress(data)
+            else:
+                text = self._decompressLast()
+            if len(self._cache) >= CACHED_FRAMES:
+                self._cache.popitem(last=False)
+        self._cache[i] = text
+        return text
+
+    def _decompressLast(self):
+        # The last frame may be followed by one the runtime is still writing.
+        d = _decompressor()
+        parts = []
+        data = self._file.read(READ_CHUNK)
+        while data and not d.unused_data:
+            parts.append(d.decompress(data))
+            data = self._file.read(READ_CHUNK)
+        return ''.join(parts)
+
+    def frameAt(self, offset):
+        """
+        Returns the number of the frame holding offset.
+        """
+        return max(0, bisect.bisect_right(self._starts, offset) - 1)
+
+    def __getitem__(self, i):
+        if not isinstance(i, slice):
+            if i < 0:
+                i += self._size
+            if not 0 <= i < self._size:
+                raise IndexError(i)
+            return self[i:i + 1]
+        start, stop, _ = i.indices(self._size)
+        parts = []
+        n = self.frameAt(start)
+        while start < stop:
+            text = self.frame(n)
+            begin = start - self._starts[n]
+            part = text[begin:begin + stop - start]
+            if not part:
+                break
+            parts.append(part)
+            start += len(part)
+            n += 1
+        return ''.join(parts)
+
+    def find(self, sub, start=0, end=None):
+        """
+        Like str.find for a sub that cannot span frames, such as '\\n'.
+        """
+        end = self._size if end is None else min(end, self._size)
+        n = self.frameAt(start)
+        while start < end and n < len(self._starts):
+            base = self._starts[n]
+            found = self.frame(n).find(sub, start - base, end - base)
+            if found != -1:
+                return base + found
+            n += 1
+            if n < len(self._starts):
+                start = self._starts[n]
+        return -1
+
+    def rfind(self, sub, start=0, end=None):
+        """
+        Like str.rfind for a sub that cannot span frames, such as '\\n'.
+        """
+        end = self._size if end is None else min(end, self._size)
+        if end <= start:
+            return -1
+        n = self.frameAt(end - 1)
+        while n >= 0:
+            base = self._starts[n]
+            found = self.frame(n).rfind(sub, max(start - base, 0), end - base)
+            if found != -1:
+                return base + found
+            if base <= start:
+                break
+            end = base
+            n -= 1
+        return -1
+
+    def close(self):
+        self._cache.clear()
+        self._file.close()
+
+
+class CompressedTraceFile(object):
+    """
+    Read-only file object over a CompressedTrace: seek() and tell() take
+    uncompressed offsets, and iterating yields lines from the current offset.
+    """
+
+    def __init__(self, trace_file):
+        self.trace = CompressedTrace(trace_file)
+        self._offset = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._offset
+        elif whence == os.SEEK_END:
+            offset += len(self.trace)
+        self._offset = offset
+
+    def tell(self):
+        return self._offset
+
+    def read(self, size=-1):
+        stop = len(self.trace) if size < 0 else self._offset + size
+        data = self.trace[self._offset:stop]
+        self._offset += len(data)
+        return data
+
+    def __iter__(self):
+        trace = self.trace
+        partial = ''
+        n = trace.frameAt(self._offset)
+        begin = self._offset - trace._starts[n]
+        while n < len(trace._starts):
+            text = trace.frame(n)
+            end = text.find('\n', begin)
+            if partial and end != -1:
+                # A line split across frames (gzip files not written by the
+                # runtime).
+                line = partial + text[begin:end + 1]
+                partial = ''
+                self._offset += len(line)
+                yield line
+                begin = end + 1
+                end = text.find('\n', begin)
+            while end != -1:
+                line = text[begin:end + 1]
+                self._offset += len(line)
+                yield line
+                begin = end + 1
+                end = text.find('\n', begin)
+            partial += text[begin:]
+            n += 1
+            begin = 0
+        if partial:
+            self._offset += len(partial)
+            yield partial
+
+    def close(self):
+        self.trace.close()
+
+
+def openTrace(trace_file):
+    """
+    Opens a plain or compressed trace for reading lines.
+    """
+    if isCompressed(trace_file):
+        return CompressedTraceFile(trace_file)
+    return open(trace_file, 'rb')
+
+
+def mapTrace(trace_file):
+    """
+    Returns the text of a plain or compressed trace as a buffer supporting
+    len(), slicing, find() and rfind(): an mmap, a CompressedTrace, or '' for
+    an empty file.
+    """
+    if not os.path.getsize(trace_file):
+        # mmap refuses empty files.
+        return ''
+    if isCompressed(trace_file):
+        return CompressedTrace(trace_file)
+    with open(trace_file, 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def traceSize(trace_file):
+    """
+    Returns the uncompressed size of a plain or compressed trace.
+    """
+    if os.path.getsize(trace_file) and isCompressed(trace_file):
+        trace = CompressedTrace(trace_file)
+        try:
+            return len(trace)
+        finally:
+            trace.close()
+    return os.path.getsize(trace_file)
+
+
+def main():
+    if len(sys.argv) != 2:
+        sys.stderr.write("usage: {0} <compressed trace>\n".format(sys.argv[0]))
+        sys.exit(1)
+    with openTrace(sys.argv[1]) as f:
+        for line in f:
+            sys.stdout.write(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -15,6 +15,9 @@ TRACE_FILE=${1:-/tmp/testfs.py}
 BLOCK_SIZE=64
 DEST_DIR=backtrace
 BNUM_TAINT_FILE=bnum_taint_file
+DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )
+# traceServer.py keeps the trace index loaded between queries
+QUERY="python $DIR/traceQuery.py --trace $TRACE_FILE"
 
 if [[ ! -f $TRACE_FILE ]]; then
 	echo "File $TRACE_FILE does not exist"
@@ -46,7 +49,7 @@ createBlockVisualizeFile() {
 	fileReverse=$DEST_DIR/$blockNumber\.$blockTaint\.reverse   # temporary file name, contains reverse of block backtrace
 	fileName=$DEST_DIR/$blockNumber\.$blockTaint\.visualize   # valid python visualize file
 
-	python traceWithICMP.py -b $blockTaint $TRACE_FILE > $fileBack
+	$QUERY backtrace t$blockTaint > $fileBack
 
 	#tac $fileBack > $fileReverse
 	#rm $fileBack
@@ -60,7 +63,7 @@ createBlockVisualizeFile() {
 # BlockTaint=B(BlockSize ,BlockNumber, BlockSizeTaint, Block number Taint)
 # for each block, it now generates a valid python visualization file
 
-cat /tmp/testfs.py | grep "B(64" | cut -d"(" -f2 | cut -d")" -f1 | cut -d "," -f2,4,5 | sort -u -t, -k 1,2 > $BNUM_TAINT_FILE
+$QUERY blocks | grep "B(64" | cut -d"(" -f2 | cut -d")" -f1 | cut -d "," -f2,4,5 | sort -u -t, -k 1,2 > $BNUM_TAINT_FILE
 	
 while read line
 do
@@ -69,3 +72,4 @@ do
 done < $BNUM_TAINT_FILE
 
 rm $BNUM_TAINT_FILE
+$QUERY shutdown
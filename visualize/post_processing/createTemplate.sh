@@ -54,14 +54,16 @@ for file in $FILES; do
 	echo "removeConstants=$removeConstants" >> $WORKING_DIR/baseTemplateFunctions/body.py
 	tac $file >> $WORKING_DIR/baseTemplateFunctions/body.py
 	
-	# Create a temporary Python file to process the generated tainted operations.
-	cat $WORKING_DIR/baseTemplateFunctions/head.py $WORKING_DIR/baseTemplateFunctions/body.py >> $WORKING_DIR/prenormalize/$file.py
+	# Keep a copy of the tainted operations; they are interpreted line by line
+	# with the functions in baseTemplateFunctions/head.py.
+	cp $WORKING_DIR/baseTemplateFunctions/body.py $WORKING_DIR/prenormalize/$file.py
 	#echo "print $taintValue" >> template/$1.py
 	
 	# 0 - place variables as constants.
 	# 1 - retain variables
 	blockNumber=`echo $file | cut -d'.' -f1`
-	python $WORKING_DIR/prenormalize/$file.py > $WORKING_DIR/templates/$file.template
+	python $WORKING_DIR/../interpret.py $WORKING_DIR/baseTemplateFunctions/head.py \
+		$WORKING_DIR/prenormalize/$file.py > $WORKING_DIR/templates/$file.template
 	#$WORKING_DIR/computeTemplateCksum.sh $file $blockNumber $removeConstants
 done
 
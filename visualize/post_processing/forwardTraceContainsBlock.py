@@ -1,50 +1,22 @@
 import argparse
 import re
 import sys
+from traceIndex import getTraceIndex
 
 traceFile = "/tmp/testfs.py"
 
+# the forward trace of taint_val contains a block if anything derived from it
+# becomes a block size or number; the index answers this for every taint at
+# once (see TraceIndex.reachesBlock)
 def forwardTraceContainsBlock(taint_val,trace_file):
 #	print "for taint",taint_val," trace file ",trace_file
-	with open(trace_file, 'r') as f:
-		curset = set() 
-		relevant_lines = []
-		flag = True
-		printFunctionNames = None
-		taint_val_eq = taint_val + '='
+	return getTraceIndex(trace_file).reachesBlock(taint_val)
 
-        # Forward pass
-		relevant = set([taint_val])
-
-		for line in (f.readlines()):
-			if line[0] == '#' or taint_val_eq in line:
-				continue
-			line = line.strip()
-           # Match
-			curlineset = {}
-			curlineset = set(re.findall(r"t[0-9]+", line))
-			if relevant.intersection(curlineset) and len(curlineset):
-				for taint in curlineset:
-					assignedTaint=taint+'='
-					#print "assignedTaint",assignedTaint
-					if assignedTaint in line:
-					#	print "added taint ",taint," to relevant set"
-						relevant.add(taint)
-					#	print relevant
-				#print "Curset =",curset," relevant = ", relevant
-				relevant_lines.append(line)
-				if 'B(' in line:
-					return True	
-				for taint in curset:
-					if taint not in relevant:
-						relevant.add(taint)
-				
-					
-		for line in (relevant_lines):
-			#print line
-			if 'B(' in line:
-           			return True
-	return False
+# batched forwardTraceContainsBlock: returns the taints of taintList whose
+# forward trace contains a block
+def forwardTracesContainingBlock(taintList, trace_file):
+	index = getTraceIndex(trace_file)
+	return set(taint for taint in taintList if index.reachesBlock(taint))
 
 if __name__ == "__main__":
     forwardTraceContainsBlock(sys.argv[1],traceFile)
@@ -1,6 +1,7 @@
 import argparse
 from collections import defaultdict
 import re
+from traceIndex import getTraceIndex, taintId
 
 BLOCK_SIZE = 64
 blockContents = defaultdict(list)
@@ -41,38 +42,46 @@ def evaluateWritePath(traceFile, writeTaint, prevReadTaint, blockNumber, zeroCon
     if blockNumber not in blockContents:
         blockContents[int(blockNumber)] = ['U'] * BLOCK_SIZE
 
-    with open(traceFile, 'r') as f:
-        input_lines = f.readlines()
-        # print writeTaint
-        count = 0
-        offsets = defaultdict(list)
-        offset = -1
-        continuous_writes = False
-        for line in input_lines:
-            if (writeTaint + '[') in line:
-                continuous_writes = True
-                # print(writeTaint, line)
-                offset = int(line.split('[')[1].split(']')[0])
-                leftTaint = line.split('=')[0].split('[')[0]
-                rightTaint = line.split('=')[1].split('[')[0]
-
-                if rightTaint == zeroConstantTaint: # assigning zero
-                    blockContents[int(blockNumber)][int(offset)] = 'Z'
-                elif prevReadTaint is None:
-                    blockContents[int(blockNumber)][int(offset)] = 'A'
-                    count+=1
-                    offsets[int(blockNumber)].append(offset)
-                elif rightTaint != prevReadTaint:
-                    blockContents[int(blockNumber)][int(offset)] = 'A'
-                    count+=1
-                    offsets[int(blockNumber)].append(offset)
-            else:
-                if continuous_writes == True:
-                    blockAllocationCountSet[blockNumber].append(str(count))
-                    #print blockAllocationCountSet[blockNumber]
-                    if len(offsets[int(blockNumber)]) != 0:
-                        blockIntervalSet[blockNumber].extend(getSection(offsets[int(blockNumber)]))
-                continuous_writes = False
+    index = getTraceIndex(traceFile)
+    # print writeTaint
+    count = 0
+    offsets = defaultdict(list)
+    offset = -1
+    prev = None
+
+    def endOfWrites():
+        blockAllocationCountSet[blockNumber].append(str(count))
+        #print blockAllocationCountSet[blockNumber]
+        if len(offsets[int(blockNumber)]) != 0:
+            blockIntervalSet[blockNumber].extend(getSection(offsets[int(blockNumber)]))
+
+    # Only lines mentioning writeTaint can match; any other line in between
+    # ends a run of continuous writes.
+    for n in index.uses.get(taintId(writeTaint), ()):
+        line = index.line(n)
+        if (writeTaint + '[') not in line:
+            continue
+        if prev is not None and n != prev + 1:
+            endOfWrites()
+        prev = n
+        # print(writeTaint, line)
+        offset = int(line.split('[')[1].split(']')[0])
+        leftTaint = line.split('=')[0].split('[')[0]
+        rightTaint = line.split('=')[1].split('[')[0]
+
+        if rightTaint == zeroConstantTaint: # assigning zero
+            blockContents[int(blockNumber)][int(offset)] = 'Z'
+        elif prevReadTaint is None:
+            blockContents[int(blockNumber)][int(offset)] = 'A'
+            count+=1
+            offsets[int(blockNumber)].append(offset)
+        elif rightTaint != prevReadTaint:
+            blockContents[int(blockNumber)][int(offset)] = 'A'
+            count+=1
+            offsets[int(blockNumber)].append(offset)
+
+    if prev is not None and prev + 1 < len(index):
+        endOfWrites()
 
 def removePadding():
     """
@@ -108,18 +117,18 @@ def evaluateReadPath(traceFile, readTaint, blockNumber):
     """
     global blockContents
 
+    index = getTraceIndex(traceFile)
     offsetList = set()
-    with open(traceFile, 'r') as f:
-        input_lines = f.readlines()
-        for line in input_lines:
-            if readTaint+'[' in line and 'O' in line:
-                TaintAndOffsetList = re.findall(readTaint + r'\[\d+\]', line)
-                for items in TaintAndOffsetList:
-                    # offsetList.extend(re.findall('\[(\d+)\]', items))
-                    offsetList |= set(re.findall('\[(\d+)\]', items))
-		    for offset in offsetList:
-			if blockNumber not in blockContents:
-				blockContents[int(blockNumber)][int(offset)] = 'A'
+    for n in index.uses.get(taintId(readTaint), ()):
+        line = index.line(n)
+        if readTaint+'[' in line and 'O' in line:
+            TaintAndOffsetList = re.findall(readTaint + r'\[\d+\]', line)
+            for items in TaintAndOffsetList:
+                # offsetList.extend(re.findall('\[(\d+)\]', items))
+                offsetList |= set(re.findall('\[(\d+)\]', items))
+                for offset in offsetList:
+                    if blockNumber not in blockContents:
+                        blockContents[int(blockNumber)][int(offset)] = 'A'
 
 """
 1.  Create list of all block_lines of the form B() # r or B() # w where r and w specify read 
@@ -146,14 +155,12 @@ def getAllocatedBytes(traceFile):
     blockTaintDict = defaultdict(list)
     zeroConstantTaint = None
 
-    block_lines = []
-    with open(traceFile, 'r') as f:
-        input_lines = f.readlines()
-        for line in input_lines:
-            if 'B(' in line:
-                block_lines.append(line)
-            elif 'V(0' in line:
-                zeroConstantTaint = re.findall(r'(t\d+)=', line)[0]
+    index = getTraceIndex(traceFile)
+    block_lines = [index.line(n) for n in index.blocks]
+    for n in index.linesOfKind('V'):
+        line = index.line(n)
+        if 'V(0' in line:
+            zeroConstantTaint = re.findall(r'(t\d+)=', line)[0]
 
     assert zeroConstantTaint
 #    print("Taint assigned for V(0): {}".format(zeroConstantTaint))
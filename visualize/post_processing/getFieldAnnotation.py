@@ -3,6 +3,7 @@ import os
 import re
 from collections import defaultdict
 from nonTypedBlocks import getSourceTaintInICMPs
+from traceIndex import getTraceIndex
 
 """
  Collect all taints involved in ICMP Operations
@@ -23,23 +24,20 @@ from nonTypedBlocks import getSourceTaintInICMPs
 traceFile="/tmp/testfs.py"
 
 def getAnnotation(taint):
-    with open(traceFile, 'r') as f:
-        for line in f:
-            if taint+'=' in line:
-                if '=V' in line:
-                    return 'V'
-                elif '=M' in line:
-                    return 'M'
-                elif '=O' in line:
-                    return 'O'
-                else: 
-                    return 'X'
+    line = getTaintLine(taint)
+    if line is None:
+        return None
+    if '=V' in line:
+        return 'V'
+    elif '=M' in line:
+        return 'M'
+    elif '=O' in line:
+        return 'O'
+    else: 
+        return 'X'
 
 def getTaintLine(taint):
-    with open(traceFile, 'r') as f:
-        for line in f:
-            if taint+'=' in line:
-                return line
+    return getTraceIndex(traceFile).definition(taint)
 
 #concatinates block number and offsets in the form of a map key
 # key = b92.20-21-22-23
@@ -66,25 +64,22 @@ def comparedTaintIsConstant(taint):
     if taint is None:
         print "ERROR - ICMP value corrupted"
         return
-    taintVal = 't'+taint+'='
-    with open(traceFile, 'r') as f:
-        inputlines = f.readlines()
-        for lines in inputlines:
-            if taintVal in lines:
-                if 'V' in lines:
-                    return True
+    index = getTraceIndex(traceFile)
+    for n in index.defs.get(int(taint), ()):
+        if 'V' in index.line(n):
+            return True
     return False
 
 def taintDoesBinaryOperation(taint):
     taintVal = 't'+taint
-    with open(traceFile, 'r') as f:
-        inputlines = f.readlines()
-        for lines in inputlines:
-            if taintVal+',' in lines or taintVal+'=' in lines:
-                #print taintVal, lines
-                if 'A' in lines:
-                    #print taintVal , lines
-                    return True
+    index = getTraceIndex(traceFile)
+    for n in index.uses.get(int(taint), ()):
+        lines = index.line(n)
+        if taintVal+',' in lines or taintVal+'=' in lines:
+            #print taintVal, lines
+            if 'A' in lines:
+                #print taintVal , lines
+                return True
     #print "taint ", taintVal, " does not have 'A' operation"
     return False
 
@@ -98,39 +93,38 @@ def getFieldAnnotation(MapAll, taintBlockMap):
     # to their destinaition block
     referredSrcTaints = getSourceTaintInICMPs(taintBlockMap)
     blockField = defaultdict(list)
-    with open(traceFile, 'r') as f:
-        input_lines = f.readlines()
-        icmp_lines = list()
-        for lines in input_lines:
-            if 'ICMP' in lines:
-                icmp_lines.append(lines)
-                taint_Blocknumber_Comparatortaint = lines.split(' ')
-                # select ICMP lines that have all 3 values - taint, block number and fieldtaint
-                if len(taint_Blocknumber_Comparatortaint) == 4:
-                    taint = taint_Blocknumber_Comparatortaint[1]
-                    blockNumber = taint_Blocknumber_Comparatortaint[2]
-                    comparatorTaint = taint_Blocknumber_Comparatortaint[3].rstrip()
-                    annotation = getAnnotation(taint)
-                    #if taint being compared is that of a constant V or a memory allocation M, it cannot be  
-                    #field value. the annotation that has field value is only an O object or a B block
-                    if annotation == 'M' or annotation == 'V':
-                        continue
-                    # if taint is not being referred between source and destination block, 
-                    # do not process this as a potential field annotation
-                    if taint not in referredSrcTaints:
-                        continue
-                    elif annotation == 'O':
-                        taintLine = getTaintLine(taint)
-                        #print "TAINT LINE IS ",taintLine
-                        (key, offsetStr) = generateKeyAndOffsetString(taintLine,blockNumber)
-                        #print "KEY ", key, " OFFSETSTR", offsetStr
-                        # check if offset is pointer
-                        if offsetIsPointer(blockField, blockNumber,MapAll,offsetStr,key) is False:
-                        # check if taint being compared to is a constant value
-                            if comparedTaintIsConstant(comparatorTaint) is True:
-                                if taintDoesBinaryOperation(taint) is False:
-                                    if offsetStr not in blockField[blockNumber]:
-                                        blockField[blockNumber].append(offsetStr)
+    index = getTraceIndex(traceFile)
+    icmp_lines = list()
+    for n in index.icmps:
+        lines = index.line(n)
+        icmp_lines.append(lines)
+        taint_Blocknumber_Comparatortaint = lines.split(' ')
+        # select ICMP lines that have all 3 values - taint, block number and fieldtaint
+        if len(taint_Blocknumber_Comparatortaint) == 4:
+            taint = taint_Blocknumber_Comparatortaint[1]
+            blockNumber = taint_Blocknumber_Comparatortaint[2]
+            comparatorTaint = taint_Blocknumber_Comparatortaint[3].rstrip()
+            annotation = getAnnotation(taint)
+            #if taint being compared is that of a constant V or a memory allocation M, it cannot be  
+            #field value. the annotation that has field value is only an O object or a B block
+            if annotation == 'M' or annotation == 'V':
+                continue
+            # if taint is not being referred between source and destination block, 
+            # do not process this as a potential field annotation
+            if taint not in referredSrcTaints:
+                continue
+            elif annotation == 'O':
+                taintLine = getTaintLine(taint)
+                #print "TAINT LINE IS ",taintLine
+                (key, offsetStr) = generateKeyAndOffsetString(taintLine,blockNumber)
+                #print "KEY ", key, " OFFSETSTR", offsetStr
+                # check if offset is pointer
+                if offsetIsPointer(blockField, blockNumber,MapAll,offsetStr,key) is False:
+                # check if taint being compared to is a constant value
+                    if comparedTaintIsConstant(comparatorTaint) is True:
+                        if taintDoesBinaryOperation(taint) is False:
+                            if offsetStr not in blockField[blockNumber]:
+                                blockField[blockNumber].append(offsetStr)
     return blockField
 
 if __name__ == "__main__":
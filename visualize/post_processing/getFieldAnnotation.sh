@@ -20,6 +20,9 @@ if [ "$#" -eq "0" ]; then
 fi
 
 taintFile=$1
+DIR=$( cd "$( dirname "${BASH_SOURCE[0]}" )" && pwd )
+# traceServer.py keeps the trace index loaded between queries
+QUERY="python $DIR/traceQuery.py --trace $taintFile"
 
 # Collect all taints involved in ICMP Operations
 
@@ -43,8 +46,8 @@ while read line;
 do
 	# Check if Taints are values,binary operations or memory allocations -> discard
 	# since FIELD values will never be used for such operations
-	taint='t'$line'='
-	line=`cat $taintFile | grep $taint`
+	taint='t'$line
+	line=`$QUERY def $taint`
 	if [[ $line == *"V"* ]]; then
 		continue
 	elif [[ $line == *"A"* ]]; then
@@ -54,18 +57,16 @@ do
 	elif [[ $line == *"O"* ]]; then
 		while read line2; 
 		do
-			if [[ $line2 == *"$line"* ]]; then
-				if [[ $line2 == *"M"* ]]; then
-					continue
-				elif [[ $line2 == *"A"* ]]; then
-					continue
-				else
-					echo $line >> /tmp/objTaints
-				fi
-			fi 
-		done < $taintFile
+			if [[ $line2 == *"M"* ]]; then
+				continue
+			elif [[ $line2 == *"A"* ]]; then
+				continue
+			else
+				echo $line >> /tmp/objTaints
+			fi
+		done < <($QUERY grep "$line")
 	else
-		echo $taint >> /tmp/objTaints
+		echo $taint= >> /tmp/objTaints
 		echo $line
 	fi
 done < /tmp/taints
@@ -87,22 +88,15 @@ do
 	
 	blockTaint=`echo $objLine | cut -d"=" -f2 | cut -d"," -f1 | cut -d"t" -f2`
 #	echo blockTaint , $blockTaint
-	blockTaintLine="t"$blockTaint"="
-	while read blockLines; 
-	do
-		if [[ $blockLines == *"$blockTaintLine"* ]]; then
-#			echo blockLines , $blockLines
-#			echo blockTaintLine, $blockTaintLine , "expect t+<blockTaint> + ="
-#			echo blockLines , $blockLines , "B() "
-			blockNum=`echo $blockLines | cut -d"," -f2`
-		fi
-	done < $taintFile
+	blockNum=`$QUERY block t$blockTaint | tail -n 1`
 
 	#echo $objTaint $blockTaint $blockNum $offset
 	echo $objTaint $blockNum $offset
 
 done < /tmp/objTaints
 
+$QUERY shutdown
+
 # make a list of all block taints that O objects refer to.
 
 #rm /tmp/taints
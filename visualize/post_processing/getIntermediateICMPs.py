@@ -1,57 +1,57 @@
 import argparse
+import bisect
 import re
 import sys
+from sliceCache import getSliceCache
+from traceIndex import getTraceIndex
 
 # for a given destination block taint Value, returns the source block and the offset
 # list of the source block that was pointing to the destination block
 
 trace_file = "/tmp/testfs.py"
 
+def relevantLines(index, taint_val):
+	"""
+	Yields the backward slice of taint_val, last line first, interleaved with
+	the raw ICMP lines that precede the definition of taint_val.
+	"""
+	backward = getSliceCache(index.trace_file).lines(taint_val)
+	for first, line in backward:
+		yield line
+		break
+	else:
+		return
+	icmps = index.icmps
+	i = bisect.bisect_left(icmps, first) - 1
+	for n, line in backward:
+		while i >= 0 and icmps[i] >= n:
+			yield index.line(icmps[i])
+			i -= 1
+		yield line
+	while i >= 0:
+		yield index.line(icmps[i])
+		i -= 1
+
 def getIntermediateICMPs(taint_val):
-	with open(trace_file, 'r') as f:
-		relevant_lines = []
-                potentialICMP = []
-                icmpblockTaint = []
-		flag = None
-		isFirstLine = True 
-		srcBlockNum = 0
+	potentialICMP = []
+	icmpblockTaint = []
+	taint_str = taint_val + '='
 
-		taint_str = taint_val + '='
-		relevant = set([taint_str])
+	# start keeping tab of ICMPs after destination taint has been
+	# intercepted. this trims all icmps before the destination
+	# block is read
+	for line in relevantLines(getTraceIndex(trace_file), taint_val):
+		if "ICMP" in line: # copy all icmp lines
+			potentialICMP.append(line)
+			continue
+		if 'B(' in line and taint_str not in line:
+			bno = re.findall('B\(64\,(.+?)\,',line)
+			potentialICMP = list(set(potentialICMP))
+			for p in potentialICMP:
+				icmpblk = p.split(' ')[2]
+				if icmpblk == bno[0]:
+					icmpblockTaint.append(p.split(' ')[1])
+					return icmpblockTaint
 
-		for line in reversed(f.readlines()):
-                        if isFirstLine is False and "ICMP" in line: 
-                        # start keeping tab of ICMPs after destination taint has been
-                        # intercepted. this trims all icmps before the destination 
-                        # block is read
-                                relevant_lines.append(line)
-			if line[0] == '#':
-                        # remove all comments from taintFile
-				continue
-			line = line.strip()
-			curset = set(re.findall(r"t[0-9]+=", line))
-		 	if relevant.intersection(curset) and len(curset):
-				if isFirstLine:
-					srcBlockNum = re.findall('B\(64\,(.+?)\,',line)
-					isFirstLine = False
-		 		cur = re.findall(r"t[0-9]+", line)
-		 		sol = []
-		 		for taint in cur:
-		 			sol.append(taint + '=')
-				relevant |= set(sol)
-				relevant_lines.append(line)
-		for line in relevant_lines:
-                        if "ICMP" in line: # copy all icmp lines
-                                potentialICMP.append(line)
-                                continue
-			if 'B(' in line and taint_str not in line:
-				bno = re.findall('B\(64\,(.+?)\,',line)
-                                potentialICMP = list(set(potentialICMP))
-                                for p in potentialICMP:
-                                    icmpblk = p.split(' ')[2]
-                                    if icmpblk == bno[0]:
-                                        icmpblockTaint.append(p.split(' ')[1])
-                                        return icmpblockTaint 
-        
 if __name__ == "__main__":
     print getIntermediateICMPs(sys.argv[1])
@@ -1,6 +1,9 @@
 import argparse
 import re
 import sys
+from sliceCache import getSliceCache
+from traceIndex import getTraceIndex, taintId
+from traceSlicer import MultiSlice, BACKWARD
 
 #if __name__ == "__main__":
 #    """ Main Start """
@@ -9,54 +12,40 @@ import sys
 # list of the source block that was pointing to the destination block
 
 def getSourceBlockNumberAndOffset(taint_val,trace_file):
-	with open(trace_file, 'r') as f:
-		relevant_lines = []
-		flag = None
-		#printFunctionNames = None
-		isFirstLine = True 
-		srcBlockNum = 0
-
-		taint_str = taint_val + '='
-		relevant = set([taint_str])
-
-		for line in reversed(f.readlines()):
-			if line[0] == '#':
-				continue
-			line = line.strip()
-			curset = set(re.findall(r"t[0-9]+=", line))
-		 	if relevant.intersection(curset) and len(curset):
-				if isFirstLine:
-					srcBlockNum = re.findall('B\(64\,(.+?)\,',line)
-					isFirstLine = False
-		 		cur = re.findall(r"t[0-9]+", line)
-		 		sol = []
-		 		for taint in cur:
-		 			sol.append(taint + '=')
-				relevant |= set(sol)
-				relevant_lines.append(line)
-	#			if printFunctionNames == True:
-	#				flag = True
-
-	#		if printFunctionNames == True:
-	#			if line.endswith("()") and flag:
-	#				relevant_lines.append(line)
-	#				flag = False
+	taint_str = taint_val + '='
+	for n, line in getSliceCache(trace_file).lines(taint_val):
+		if 'O' in line:
+			offsetList = re.findall('t[0-9]+\[(.+?)\]',line)
+			#print offsetList
+		if 'B' in line and taint_str not in line:
+			bno = re.findall('B\(64\,(.+?)\,',line)
+			return (bno[0],offsetList)
+	return (None,None)
 
-		#backTraceFile = str('backtrace/'+srcBlockNum[0]+'.'+taint_val)
-		#print backTraceFile
-		#fo = open (backTraceFile,"wb")	
-		for line in relevant_lines:
-			#fo.write(line)
-			#fo.write('\n')
+# batched getSourceBlockNumberAndOffset: returns a map taint => (source
+# block, offset list) for every taint of taintList, slicing all of them
+# together
+def getSourceBlockNumbersAndOffsets(taintList, trace_file):
+	index = getTraceIndex(trace_file)
+	slices = MultiSlice(index, taintList, BACKWARD)
+	taintStrs = {}
+	for taint in taintList:
+		taintStrs.setdefault(taintId(taint), []).append(taint + '=')
+	offsetLists = {}
+	results = {}
+	for n, seeds in slices.lines():
+		line = index.line(n).strip()
+		for seed in seeds:
 			if 'O' in line:
-				offsetList = re.findall('t[0-9]+\[(.+?)\]',line)
-				#print offsetList
-			if 'B' in line and taint_str not in line:
-				bno = re.findall('B\(64\,(.+?)\,',line)
-				#fo.close()
-				return (bno[0],offsetList)	
-	#fo.close()
-	return (None,None)
+				offsetLists[seed] = re.findall('t[0-9]+\[(.+?)\]',line)
+			if 'B' in line:
+				for taint_str in taintStrs[seed]:
+					if taint_str not in line and taint_str not in results:
+						bno = re.findall('B\(64\,(.+?)\,',line)
+						results[taint_str] = (bno[0],offsetLists.get(seed))
+				if all(taint_str in results for taint_str in taintStrs[seed]):
+					slices.drop(seed)
+	return dict((taint, results.get(taint + '=', (None,None))) for taint in taintList)
 
 if __name__ == "__main__":
     print getSourceBlockNumberAndOffset(sys.argv[1],"/tmp/testfs.py")
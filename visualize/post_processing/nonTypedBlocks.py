@@ -5,13 +5,15 @@
 
 import sys
 import os
-from getSourceBlockNumberAndOffset import getSourceBlockNumberAndOffset
-from forwardTraceContainsBlock import forwardTraceContainsBlock
+from getSourceBlockNumberAndOffset import getSourceBlockNumberAndOffset, getSourceBlockNumbersAndOffsets
+from forwardTraceContainsBlock import forwardTraceContainsBlock, forwardTracesContainingBlock
 from forwardTraceReferencesSubelements import forwardTraceReferencesSubelements
 from getAllocatedBytes import getAllocatedBytes
 from collections import defaultdict
 from getSourceBlock import getSourceBlock
 from getIntermediateICMPs import getIntermediateICMPs
+from traceIndex import getTraceIndex
+from sliceCache import printStats as printSliceCacheStats
 
 traceFile = "/tmp/testfs.py"
 
@@ -55,6 +57,8 @@ taintBlockMap = {} # hash <taint - blockNum>
 MapTtoNT = defaultdict(list) 
 MapTtoT = defaultdict(list) 
 blockTaintDictionary = defaultdict(list) # <BNum - t1,t2,t3>
+taintOffsetToBlock = defaultdict(list) # <offset taint - BNum>
+blocksProcessed = 0 # number of index.blocks already in the maps above
 typedBlockTaintList = [] 
 srcBlkTaintAsICMP = []
     
@@ -74,29 +78,40 @@ def loadBlockTaints(blockTaintFile):
 	blockTaints = map(lambda s: s.strip(), blockTaints)
 	return blockTaints
 
-def getSourceBlockandOffset(block, taintList):
+# sources, if given, maps taints to getSourceBlockNumberAndOffset results
+# computed in one batch (see generatePointerMaps)
+def getSourceBlockandOffset(block, taintList, sources=None):
 	#print "In getBackTraceBlock ",block,taintList
 	#table = [{}]
 	srcBlockOffsetMap = {}
 	for taint in taintList:
-		(srcBlockNo,offsetList) = getSourceBlockNumberAndOffset(taint, traceFile)
+		if sources is not None:
+			(srcBlockNo,offsetList) = sources[taint]
+		else:
+			(srcBlockNo,offsetList) = getSourceBlockNumberAndOffset(taint, traceFile)
 		if srcBlockNo is not None:
 			srcBlockOffsetMap[srcBlockNo]=offsetList
 			#table.append(srcBlockOffsetMap)
 	return srcBlockOffsetMap# (srcBlockNo,table)
 
+def updateBlockMaps(index):
+	# Adds the B() records indexed since the last call, so the maps can
+	# follow a trace that is still being written (see --follow).
+	global blocksProcessed
+	blockStr = "B("+str(blockSize)+","
+	for n in index.blocks[blocksProcessed:]:
+		line = index.line(n)
+		if blockStr in line:
+			taint = line.split("=")[0]
+			block = line.split(",")[1]
+			offsetTaint = line.split(",")[3].split('t')[1]
+			taintBlockMap[taint] = block
+			taintOffsetToBlock[offsetTaint] = block
+			blockTaintDictionary[block].append(taint)
+	blocksProcessed = len(index.blocks)
+
 def initDataStructures(): # <tNo BlockNo>
-        taintOffsetToBlock = defaultdict(list)
-	with open(traceFile,'r') as f:
-		for line in f:
-                    blockStr = "B("+str(blockSize)+","
-                    if blockStr in line:
-                        taint = line.split("=")[0]
-                        block = line.split(",")[1]
-                        offsetTaint = line.split(",")[3].split('t')[1]
-                        taintBlockMap[taint] = block
-                        taintOffsetToBlock[offsetTaint] = block
-                        blockTaintDictionary[block].append(taint)
+	updateBlockMaps(getTraceIndex(traceFile))
 	return (taintBlockMap, blockTaintDictionary, taintOffsetToBlock)
 
 # taintOffsetToBlock is a map of taintOffset -> block
@@ -119,10 +134,12 @@ def getTypeInfo():
         typedBlocks = []
         nonTypedBlocks = []
 	(taintBlockMap,blockTaintDictionary,taintOffsetToBlock) = initDataStructures()
+	# slice all block taints together instead of one forward trace each
+	containsBlock = forwardTracesContainingBlock(list(taintBlockMap), traceFile)
 	for taint in taintBlockMap:
 		isNonTypedBlock=True
 		block=taintBlockMap[taint]
-		if forwardTraceContainsBlock(taint, traceFile ) is False: # not Typed
+		if taint not in containsBlock: # not Typed
 			if list(set(blockTaintDictionary[block]) & set(typedBlockTaintList)) == []:
 				#print "Non Typed Block",block # Non Typed Block
 				nonTypedBlocks.append(block)
@@ -682,8 +699,14 @@ def createCompleteType(rootType, dataType):
 #		testType(srcBlock) 			
 
 def generatePointerMaps(typedBlocks, nonTypedBlocks):
+	# backward traces of the taints of every destination block, in one batch
+	taintList = []
+	for destinationBlock in nonTypedBlocks + typedBlocks:
+		taintList.extend(blockTaintDictionary[destinationBlock])
+	sources = getSourceBlockNumbersAndOffsets(taintList, traceFile)
+
 	for destinationBlock in nonTypedBlocks:
-		srcBlockOffsetMap = getSourceBlockandOffset(destinationBlock, blockTaintDictionary[destinationBlock])
+		srcBlockOffsetMap = getSourceBlockandOffset(destinationBlock, blockTaintDictionary[destinationBlock], sources)
 		for blk in srcBlockOffsetMap:
 			key = 'b'+str(blk)+'.'+str('-'.join(srcBlockOffsetMap[blk]))
 			MapTtoNT[key].append(destinationBlock)
@@ -691,7 +714,7 @@ def generatePointerMaps(typedBlocks, nonTypedBlocks):
 				blockDestToSrcMap[int(destinationBlock)].append(blk)
 
 	for destinationBlock in typedBlocks:
-		srcBlockOffsetMap = getSourceBlockandOffset(destinationBlock, blockTaintDictionary[destinationBlock])
+		srcBlockOffsetMap = getSourceBlockandOffset(destinationBlock, blockTaintDictionary[destinationBlock], sources)
 		for blk in srcBlockOffsetMap:
 			key = 'b'+str(blk)+'.'+str('-'.join(srcBlockOffsetMap[blk]))
 			MapTtoT[key].append(destinationBlock)
@@ -720,6 +743,17 @@ def getSourceTaintInICMPs(taintBlockMap):
 if __name__ == "__main__":
 	""" Main Start """
 
+	# --follow [PID]: build the block maps while testfs.exe (PID) is still
+	# writing the trace, then analyse it once the run ends.
+	if "--follow" in sys.argv:
+		from traceFollower import followTrace
+		follow = sys.argv.index("--follow")
+		pid = None
+		if follow + 1 < len(sys.argv) and sys.argv[follow + 1].isdigit():
+			pid = int(sys.argv[follow + 1])
+		sys.stderr.write("following %s\n" % traceFile)
+		followTrace(traceFile, lambda index, start, stop: updateBlockMaps(index), pid=pid)
+
 	nonTypedBlocks = []
 	typedBlocks = []
 
@@ -748,3 +782,6 @@ if __name__ == "__main__":
         for index in MapTtoNT:
                 MapTtoNT[index] = list(sorted(set(MapTtoNT[index])))
                 print index,MapTtoNT[index]
+
+	# hit/miss counters of the slice cache, on stderr (see sliceCache)
+	printSliceCacheStats()
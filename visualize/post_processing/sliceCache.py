@@ -0,0 +1,131 @@
+"""
+LRU cache of trace slices.
+
+A trace does not change once it is written, so the slice of a taint is the
+same every time it is asked for. The post-processing helpers ask for the
+same slices over and over: getSourceBlock, getSourceBlockNumberAndOffset and
+getIntermediateICMPs all walk the backward slice of the same block taints.
+SliceCache keeps the most recently used slices, keyed by (taint, direction,
+depth), and counts hits and misses so its capacity can be tuned
+($FSLICE_SLICE_CACHE, 1024 slices by default).
+
+Unbounded slices (depth None) are the line sequences of
+TraceIndex.backwardSlice and forwardSlice. They are cached lazily: a slice
+is only computed as far as its callers have read it, so helpers that stop
+at the first B() line keep doing so, and the next caller replays the lines
+already found before the slice is extended. Slices with a depth bound are
+the lines of traceSlicer.bfs.
+"""
+
+import os
+import sys
+from collections import OrderedDict
+
+from traceIndex import getTraceIndex, taintId
+from traceSlicer import BACKWARD, FORWARD, bfs
+
+DEFAULT_CAPACITY = 1024
+
+
+class _LazySlice(object):
+    """
+    Line numbers of a slice generator, kept as they are produced.
+    """
+
+    def __init__(self, lines):
+        self._lines = lines
+        self._found = []
+
+    def __iter__(self):
+        i = 0
+        while True:
+            if i < len(self._found):
+                yield self._found[i]
+            elif self._lines is None:
+                return
+            else:
+                try:
+                    n, _ = next(self._lines)
+                except StopIteration:
+                    self._lines = None
+                    return
+                self._found.append(n)
+                yield n
+            i += 1
+
+
+class SliceCache(object):
+
+    def __init__(self, index, capacity=DEFAULT_CAPACITY):
+        self.index = index
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        self._slices = OrderedDict()
+
+    def __len__(self):
+        return len(self._slices)
+
+    def lineNumbers(self, taint, direction=BACKWARD, depth=None):
+        """
+        Returns the line numbers of the slice of taint, in slice order (last
+        line first for a backward slice).
+
+        :param depth: maximum number of hops, or None for the whole slice
+        """
+        key = (taintId(taint), direction, depth or None)
+        lines = self._slices.pop(key, None)
+        if lines is None:
+            self.misses += 1
+            lines = self._compute(*key)
+            if len(self._slices) >= self.capacity:
+                self._slices.popitem(last=False)
+        else:
+            self.hits += 1
+        self._slices[key] = lines
+        return lines
+
+    def lines(self, taint, direction=BACKWARD, depth=None):
+        """
+        Yields (line number, stripped line) for the slice of taint.
+        """
+        for n in self.lineNumbers(taint, direction, depth):
+            yield n, self.index.line(n).strip()
+
+    def _compute(self, taint, direction, depth):
+        if depth is not None:
+            return bfs(self.index, taint, direction, depth).lineNumbers(self.index)
+        if direction == FORWARD:
+            return _LazySlice(self.index.forwardSlice(taint))
+        return _LazySlice(self.index.backwardSlice(taint))
+
+    def clear(self):
+        self._slices.clear()
+
+    def stats(self):
+        total = self.hits + self.misses
+        return "{} hits, {} misses ({:.1f}% hits), {} of {} slices cached".format(
+            self.hits, self.misses, 100.0 * self.hits / total if total else 0.0,
+            len(self._slices), self.capacity)
+
+
+_caches = {}
+
+
+def getSliceCache(trace_file):
+    """
+    Returns the SliceCache of trace_file, sized by $FSLICE_SLICE_CACHE.
+    """
+    cache = _caches.get(trace_file)
+    if cache is None:
+        capacity = int(os.environ.get('FSLICE_SLICE_CACHE', DEFAULT_CAPACITY))
+        cache = _caches[trace_file] = SliceCache(getTraceIndex(trace_file), capacity)
+    return cache
+
+
+def printStats(out=sys.stderr):
+    """
+    Prints the counters of every slice cache in use.
+    """
+    for trace_file, cache in sorted(_caches.items()):
+        out.write("slice cache {}: {}\n".format(trace_file, cache.stats()))
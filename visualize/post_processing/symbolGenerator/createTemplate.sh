@@ -1,6 +1,3 @@
-rm run.py
 rm example.py
 cp /tmp/testfs.py example.py
-cat head.py > run.py
-cat example.py >> run.py
-python run.py
+python ../../interpret.py head.py example.py
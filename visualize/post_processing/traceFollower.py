@@ -0,0 +1,120 @@
+#!/usr/bin/python
+"""
+Follows a taint trace while testfs.exe is still writing it.
+
+exec.sh redirects the stderr of testfs.exe to /tmp/testfs.py, so the trace
+grows for the whole run. TraceFollower polls the file and indexes the lines
+appended since the last poll (TraceIndex.update), so analysis that only needs
+the index can keep up with the capture instead of starting when it ends:
+
+    ./testfs/testfs.exe /tmp/fs 2> /tmp/testfs.py &
+    python visualize/post_processing/traceFollower.py /tmp/testfs.py --pid $!
+
+Following stops when the traced process exits (--pid) or when the trace has
+not grown for --idle seconds. The complete index is then saved as
+<trace>.idx, so later helpers load it instead of parsing the trace again.
+"""
+
+import argparse
+import errno
+import os
+import sys
+import time
+
+import traceIndex
+from traceIndex import TraceIndex, CACHE_SUFFIX, traceFingerprint
+
+
+def processAlive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+class TraceFollower(object):
+
+    def __init__(self, trace_file, interval=1.0, idle=30.0, pid=None):
+        """
+        :param interval: seconds between polls
+        :param idle: stop after this many seconds without new lines
+        :param pid: stop once this process has exited
+        """
+        self.trace_file = trace_file
+        self.interval = interval
+        self.idle = idle
+        self.pid = pid
+        self.index = None
+
+    def _waitForTrace(self):
+        while not os.path.exists(self.trace_file):
+            if self._done(time.time()):
+                raise IOError(errno.ENOENT, "No trace written", self.trace_file)
+            time.sleep(self.interval)
+        self._last_growth = time.time()
+        self.index = TraceIndex(self.trace_file, complete=False)
+
+    def _done(self, now):
+        if self.pid is not None:
+            return not processAlive(self.pid)
+        return now - self._last_growth >= self.idle
+
+    def follow(self, callback=None):
+        """
+        Indexes the trace until it stops growing and returns the final index.
+        callback(index, start, stop) is called with the range of new lines
+        after every poll that found some.
+        """
+        self._last_growth = time.time()
+        self._waitForTrace()
+        start = 0
+        while True:
+            # Check first, so that the lines written before exit are read.
+            done = self._done(time.time())
+            added = self.index.update(final=done)
+            if added:
+                self._last_growth = time.time()
+            if len(self.index) < start:
+                # The trace was truncated and indexed from the start again.
+                start = 0
+            if callback is not None and len(self.index) > start:
+                callback(self.index, start, len(self.index))
+                start = len(self.index)
+            if done:
+                break
+            time.sleep(self.interval)
+
+        try:
+            self.index.save(self.trace_file + CACHE_SUFFIX, traceFingerprint(self.trace_file))
+        except (IOError, OSError) as e:
+            sys.stderr.write("[WARN]: Could not save trace index {}: {}\n".format(self.trace_file, e))
+        traceIndex._indexes[self.trace_file] = self.index
+        return self.index
+
+
+def followTrace(trace_file, callback=None, interval=1.0, idle=30.0, pid=None):
+    """
+    Follows trace_file until it stops growing (see TraceFollower.follow).
+    """
+    return TraceFollower(trace_file, interval, idle, pid).follow(callback)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index a taint trace while it is being written.")
+    parser.add_argument('trace', help="trace file, e.g. /tmp/testfs.py")
+    parser.add_argument('--pid', type=int, help="stop once this process exits")
+    parser.add_argument('--idle', type=float, default=30.0,
+                        help="stop after this many seconds without new lines (default: 30)")
+    parser.add_argument('--interval', type=float, default=1.0,
+                        help="seconds between polls (default: 1)")
+    args = parser.parse_args()
+
+    def progress(index, start, stop):
+        print("{} lines, {} blocks".format(stop, len(index.blocks)))
+
+    followTrace(args.trace, progress, args.interval, args.idle, args.pid)
+
+
+if __name__ == '__main__':
+    main()
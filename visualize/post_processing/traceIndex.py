@@ -0,0 +1,820 @@
+"""
+Single-pass index over a taint trace (e.g. /tmp/testfs.py).
+
+The post-processing helpers used to reopen the trace and call readlines() for
+every taint they were asked about. TraceIndex reads the trace once and keeps,
+for every taint id, the lines that define it ("tN="), the lines that mention
+it and the lines that store into it ("tN[i]="), together with the positions of
+all B() and ICMP lines. Every line is tokenized once (see traceTokenizer), and
+the taint ids it defines and mentions are kept per line as well. Slices are
+computed from these integer tables, and only the lines that end up in a slice
+are read back from the trace.
+
+The parsed index is saved next to the trace as <trace>.idx, keyed by the size,
+mtime and a hash of the head and tail of the trace. Later runs memory-map that
+file instead of parsing the trace again. A trace that is still being written
+can be indexed as it grows with update() (see traceFollower). Traces written
+compressed by the runtime are read through their frame index (see
+compressedTrace); offsets are then offsets into the uncompressed text.
+
+Line numbers are 0-based positions in the trace file. Comment lines (lines
+starting with '#') are never part of a slice, so they only get an offset.
+"""
+
+import array
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import struct
+import sys
+from collections import defaultdict
+
+from compressedTrace import mapTrace, openTrace, traceSize
+from traceReader import TraceReader
+from traceTokenizer import COMMENT, ICMP, STORE, OTHER, NO_TAINT, tokenize, taints
+
+CACHE_MAGIC = 'FSLIDX06'
+CACHE_SUFFIX = '.idx'
+FINGERPRINT_CHUNK = 1 << 20
+# Traces are not split into shards smaller than this.
+MIN_SHARD_SIZE = 1 << 20
+INT_TYPE = 'l'
+
+
+def taintId(taint):
+    """
+    Accepts 't12', '12' or 12 and returns 12.
+    """
+    if isinstance(taint, str):
+        return int(taint.lstrip('t'))
+    return int(taint)
+
+
+def recordKind(line):
+    """
+    Returns the kind byte of a raw trace line.
+    """
+    return tokenize(line).kind
+
+
+def traceFingerprint(trace_file):
+    """
+    Returns [size, mtime, sha1 of the first and last MiB] of trace_file.
+    """
+    st = os.stat(trace_file)
+    digest = hashlib.sha1()
+    with open(trace_file, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if st.st_size > FINGERPRINT_CHUNK:
+            f.seek(max(FINGERPRINT_CHUNK, st.st_size - FINGERPRINT_CHUNK))
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return [st.st_size, st.st_mtime, digest.hexdigest()]
+
+
+class _ArrayView(object):
+    """
+    Read-only sequence of integers stored in a memory-mapped cache section.
+    """
+
+    def __init__(self, buf, offset, count):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self._size = struct.calcsize(INT_TYPE)
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, _ = i.indices(self._count)
+            if stop <= start:
+                return ()
+            return struct.unpack_from('{}{}'.format(stop - start, INT_TYPE), self._buf,
+                                      self._offset + start * self._size)
+        if i < 0:
+            i += self._count
+        if not 0 <= i < self._count:
+            raise IndexError(i)
+        return struct.unpack_from(INT_TYPE, self._buf, self._offset + i * self._size)[0]
+
+    def __iter__(self):
+        for start in range(0, self._count, 4096):
+            for value in self[start:start + 4096]:
+                yield value
+
+    def toarray(self):
+        data = array.array(INT_TYPE)
+        data.fromstring(self._buf[self._offset:self._offset + self._count * self._size])
+        return data
+
+
+def toArray(values):
+    """
+    Returns values (an array or a cache section) as an in-memory array.
+    """
+    if isinstance(values, _ArrayView):
+        return values.toarray()
+    return values
+
+
+class _CsrMap(object):
+    """
+    Read-only taint id => line numbers map (or line number => taint ids),
+    stored as a pointer array indexed by the key and one flat array of values.
+    """
+
+    def __init__(self, ptr, lines):
+        self._ptr = ptr
+        self._lines = lines
+
+    def get(self, taint, default=None):
+        if not 0 <= taint < len(self._ptr) - 1:
+            return default
+        start, stop = self._ptr[taint:taint + 2]
+        if start == stop:
+            return default
+        return self._lines[start:stop]
+
+    def __getitem__(self, taint):
+        lines = self.get(taint)
+        if lines is None:
+            raise KeyError(taint)
+        return lines
+
+    def __contains__(self, taint):
+        return self.get(taint) is not None
+
+    def loaded(self):
+        """
+        Returns a copy whose arrays are decoded into memory, for callers that
+        walk most of the map.
+        """
+        return _CsrMap(toArray(self._ptr), toArray(self._lines))
+
+
+def _csr(mapping):
+    """
+    Flattens a taint id => line numbers dict into (ptr, lines) arrays.
+    """
+    size = max(mapping) + 1 if mapping else 0
+    ptr = array.array(INT_TYPE, [0]) * (size + 1)
+    lines = array.array(INT_TYPE)
+    for taint in range(size):
+        lines.extend(mapping.get(taint, ()))
+        ptr[taint + 1] = len(lines)
+    return ptr, lines
+
+
+class TraceIndex(object):
+
+    def __init__(self, trace_file, complete=True, jobs=1):
+        """
+        :param complete: False if trace_file is still being written, in
+                         which case a last partial line is left for update()
+        :param jobs: number of processes parsing the trace (see _buildSharded)
+        """
+        self.trace_file = trace_file
+        self._reset()
+        if complete and jobs > 1 and traceSize(trace_file) >= MIN_SHARD_SIZE * 2:
+            self._buildSharded(jobs)
+        else:
+            self.update(final=complete)
+
+    def _reset(self):
+        # Byte offset of every line, plus the indexed size as a sentinel.
+        self.offsets = array.array(INT_TYPE, [0])
+        # Record kind of every line (see recordKind).
+        self.kinds = bytearray()
+        # taint id => line numbers of "tN=" definitions
+        self.defs = defaultdict(list)
+        # taint id => line numbers of every line mentioning tN (including defs)
+        self.uses = defaultdict(list)
+        # taint id => line numbers of "tN[i]=" stores into tN
+        self.stores = defaultdict(list)
+        # Def-use graph over taint ids. deps maps a taint to the operands of
+        # its definitions; users maps a taint to the taints defined from it,
+        # including the destinations of stores that copy it.
+        self.deps = defaultdict(list)
+        self.users = defaultdict(list)
+        # line numbers of B() records, in file order
+        self.blocks = array.array(INT_TYPE)
+        # line numbers of lines containing "ICMP", in file order
+        self.icmps = array.array(INT_TYPE)
+        # taint id defined by every line, or NO_TAINT
+        self.defined = array.array(INT_TYPE)
+        # line number => taint ids mentioned on it, each once (see _CsrMap)
+        self.lineTaints = _CsrMap(array.array(INT_TYPE, [0]), array.array(INT_TYPE))
+        # (buffer, offset, count) of one byte per taint id, 1 if its forward
+        # slice contains a B() line; computed on first use (see reachesBlock)
+        self._reach = None
+        self._reader = None
+
+    def update(self, final=False):
+        """
+        Indexes the lines appended to the trace since the last call, so the
+        index can follow a trace that is still being written. Unless final
+        is set, a last line without its newline is left for the next call.
+        Starts over if the trace was truncated. Returns the number of lines
+        added.
+        """
+        if isinstance(self.defs, _CsrMap):
+            raise ValueError("{} was loaded from its cache or parsed in shards and cannot be updated"
+                             .format(self.trace_file))
+        if traceSize(self.trace_file) < self.offsets[-1]:
+            self._reset()
+
+        offset = self.offsets.pop()
+        first = len(self.offsets)
+        with openTrace(self.trace_file) as f:
+            f.seek(offset)
+            offset, n = self._parse(f, offset, first, final)
+        self.offsets.append(offset)
+        if n > first:
+            # The reader maps the trace as it was when it was created.
+            self._reader = None
+            self._reach = None
+        return n - first
+
+    def _parse(self, f, offset, n, final, stop=None, heads=None):
+        """
+        Indexes the lines of f from byte offset (line n) up to byte stop or
+        the end of f. Returns the offset and number of the next line.
+        heads, if given, collects the taints whose first users entry comes
+        from a store (see _mergeShard).
+        """
+        ptr = self.lineTaints._ptr
+        ids = self.lineTaints._lines
+        for line in f:
+            if not final and not line.endswith('\n'):
+                break
+            self.offsets.append(offset)
+            offset += len(line)
+            record = tokenize(line)
+            self.kinds.append(record.kind)
+            self.defined.append(record.defined)
+            if 'ICMP' in line:
+                self.icmps.append(n)
+            if record.kind != COMMENT:
+                if record.defined != NO_TAINT:
+                    self.defs[record.defined].append(n)
+                seen = set()
+                for taint in taints(record):
+                    if taint not in seen:
+                        seen.add(taint)
+                        ids.append(taint)
+                        self.uses[taint].append(n)
+                unique = ids[ptr[-1]:]
+                if record.defined != NO_TAINT:
+                    for taint in unique:
+                        if taint != record.defined:
+                            self.deps[record.defined].append(taint)
+                            self.users[taint].append(record.defined)
+                if record.kind == STORE:
+                    dest = record.operands[0]
+                    self.stores[dest].append(n)
+                    for taint in unique:
+                        # Stores come in runs of bytes from one source.
+                        users = self.users[taint]
+                        if taint != dest and (not users or users[-1] != dest):
+                            if not users and heads is not None:
+                                heads.add(taint)
+                            users.append(dest)
+                if 'B(' in line:
+                    self.blocks.append(n)
+            ptr.append(len(ids))
+            n += 1
+            if stop is not None and offset >= stop:
+                break
+        return offset, n
+
+    def _buildSharded(self, jobs):
+        """
+        Parses the trace in jobs processes. The trace is cut at line
+        boundaries into byte ranges; the first pass counts the lines of each
+        range so every shard numbers its lines like a sequential parse would,
+        the second parses the shards. Every shard sends its line tables back
+        as array strings, and they are concatenated. The taint maps are then
+        built from them in CSR form (see _csr) with NumPy, except users,
+        whose store runs are only known to the shards: each shard sends its
+        (taint, user) pairs, merged by taint in file order.
+
+        The maps of a sharded index are _CsrMaps, as for a cached one, so
+        it cannot be updated.
+        """
+        import multiprocessing
+
+        bounds = _shardBounds(self.trace_file, jobs)
+        ranges = [(self.trace_file, start, stop) for start, stop in zip(bounds, bounds[1:])]
+        pool = multiprocessing.Pool(len(ranges))
+        try:
+            counts = pool.map(_countLines, ranges)
+            firsts = [sum(counts[:i]) for i in range(len(counts))]
+            shards = pool.map(_parseShard, [r + (first,) for r, first in zip(ranges, firsts)])
+        finally:
+            pool.terminate()
+
+        self.offsets = _joinArrays(shard['offsets'] for shard in shards)
+        self.offsets.append(bounds[-1])
+        self.kinds = bytearray().join(shard['kinds'] for shard in shards)
+        for name in ('defined', 'blocks', 'icmps'):
+            setattr(self, name, _joinArrays(shard[name] for shard in shards))
+        self.lineTaints = _CsrMap(*_joinCsr([(shard['lineTaints.ptr'], shard['lineTaints.ids'])
+                                             for shard in shards]))
+        self._buildTaintMaps()
+        self.users = _CsrMap(*_mergeUsers([shard['users'] for shard in shards]))
+
+    def _buildTaintMaps(self):
+        """
+        Builds defs, uses, stores and deps from lineTaints, defined and
+        kinds, with the same lines in the same order as _parse.
+        """
+        import numpy as np
+
+        dtype = np.dtype(INT_TYPE)
+        ptr = np.frombuffer(self.lineTaints._ptr, dtype)
+        ids = np.frombuffer(self.lineTaints._lines, dtype)
+        defined = np.frombuffer(self.defined, dtype)
+        kinds = np.frombuffer(self.kinds, np.uint8)
+        counts = np.diff(ptr)
+        line = np.repeat(np.arange(len(counts), dtype=dtype), counts)
+        self.uses = _CsrMap(*_csrArrays(ids, line))
+        defs = np.flatnonzero(defined != NO_TAINT)
+        self.defs = _CsrMap(*_csrArrays(defined[defs], defs))
+        stores = np.flatnonzero((kinds == ord(STORE)) & (counts > 0))
+        self.stores = _CsrMap(*_csrArrays(ids[ptr[stores]], stores))
+        # Every taint of a definition other than the defined one.
+        owner = defined[line]
+        deps = (owner != NO_TAINT) & (ids != owner)
+        self.deps = _CsrMap(*_csrArrays(owner[deps], ids[deps]))
+
+    @classmethod
+    def load(cls, trace_file, cache=True, jobs=1):
+        """
+        Returns the index of trace_file, memory-mapping <trace_file>.idx when
+        it matches the trace and parsing (then saving) the trace otherwise,
+        in jobs processes.
+        """
+        if not cache:
+            return cls(trace_file, jobs=jobs)
+        cache_file = trace_file + CACHE_SUFFIX
+        fingerprint = traceFingerprint(trace_file)
+        index = cls._fromCache(trace_file, cache_file, fingerprint)
+        if index is None:
+            index = cls(trace_file, jobs=jobs)
+            try:
+                index.save(cache_file, fingerprint)
+            except (IOError, OSError) as e:
+                sys.stderr.write("[WARN]: Could not save trace index {}: {}\n".format(cache_file, e))
+        return index
+
+    @classmethod
+    def _fromCache(cls, trace_file, cache_file, fingerprint):
+        try:
+            with open(cache_file, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, OSError, ValueError):
+            return None
+        if buf[:len(CACHE_MAGIC)] != CACHE_MAGIC:
+            return None
+        start = len(CACHE_MAGIC) + 4
+        header_size = struct.unpack_from('<I', buf, len(CACHE_MAGIC))[0]
+        header = json.loads(buf[start:start + header_size])
+        if header['fingerprint'] != fingerprint or header['itemsize'] != struct.calcsize(INT_TYPE):
+            return None
+
+        sections = header['sections']
+
+        def view(name):
+            offset, count = sections[name]
+            return _ArrayView(buf, offset, count)
+
+        index = cls.__new__(cls)
+        index.trace_file = trace_file
+        index.offsets = view('offsets')
+        index._kinds_offset = sections['kinds'][0]
+        index.kinds = buf
+        index.defs = _CsrMap(view('defs.ptr'), view('defs.lines'))
+        index.uses = _CsrMap(view('uses.ptr'), view('uses.lines'))
+        index.stores = _CsrMap(view('stores.ptr'), view('stores.lines'))
+        index.deps = _CsrMap(view('deps.ptr'), view('deps.lines'))
+        index.users = _CsrMap(view('users.ptr'), view('users.lines'))
+        index.blocks = view('blocks')
+        index.icmps = view('icmps')
+        index.defined = view('defined')
+        index.lineTaints = _CsrMap(view('lineTaints.ptr'), view('lineTaints.ids'))
+        index._reach = (buf,) + tuple(sections['reachesBlock'])
+        index._reader = None
+        return index
+
+    def save(self, cache_file, fingerprint):
+        """
+        Writes the index to cache_file, tagged with the trace fingerprint.
+        """
+        sections = [('offsets', self.offsets), ('kinds', self.kinds)]
+        for name in ('defs', 'uses', 'stores', 'deps', 'users'):
+            mapping = getattr(self, name)
+            if isinstance(mapping, _CsrMap):
+                ptr, lines = mapping._ptr, mapping._lines
+            else:
+                ptr, lines = _csr(mapping)
+            sections.append((name + '.ptr', ptr))
+            sections.append((name + '.lines', lines))
+        sections.append(('blocks', self.blocks))
+        sections.append(('icmps', self.icmps))
+        sections.append(('defined', self.defined))
+        sections.append(('lineTaints.ptr', self.lineTaints._ptr))
+        sections.append(('lineTaints.ids', self.lineTaints._lines))
+        sections.append(('reachesBlock', self._blockReach()[0]))
+
+        # Lay the sections out after the header, 8-byte aligned.
+        layout = {}
+        header = None
+        header_size = 0
+        while True:
+            position = len(CACHE_MAGIC) + 4 + header_size
+            for name, data in sections:
+                position += -position % 8
+                layout[name] = [position, len(data)]
+                position += len(data) * (data.itemsize if hasattr(data, 'itemsize') else 1)
+            header = json.dumps({'fingerprint': fingerprint,
+                                 'itemsize': struct.calcsize(INT_TYPE),
+                                 'sections': layout})
+            if len(header) == header_size:
+                break
+            header_size = len(header)
+
+        tmp_file = '{}.{}.tmp'.format(cache_file, os.getpid())
+        with open(tmp_file, 'wb') as f:
+            f.write(CACHE_MAGIC)
+            f.write(struct.pack('<I', header_size))
+            f.write(header)
+            for name, data in sections:
+                f.write('\0' * (layout[name][0] - f.tell()))
+                f.write(str(data) if isinstance(data, bytearray) else data.tostring())
+        os.rename(tmp_file, cache_file)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    @property
+    def reader(self):
+        """
+        TraceReader over the trace, using this index's line offsets.
+        """
+        if self._reader is None:
+            self._reader = TraceReader(self.trace_file, self.offsets)
+        return self._reader
+
+    def line(self, n):
+        """
+        Returns line n of the trace, including its trailing newline.
+        """
+        return self.reader.line(n)
+
+    def kind(self, n):
+        """
+        Returns the record kind of line n.
+        """
+        base = getattr(self, '_kinds_offset', 0)
+        return str(self.kinds[base + n:base + n + 1])
+
+    def linesOfKind(self, kind):
+        """
+        Yields the line numbers of every record of the given kind.
+        """
+        base = getattr(self, '_kinds_offset', 0)
+        end = base + len(self)
+        n = self.kinds.find(kind, base, end)
+        while n != -1:
+            yield n - base
+            n = self.kinds.find(kind, n + 1, end)
+
+    def definition(self, taint):
+        """
+        Returns the first line defining taint, or None.
+        """
+        lines = self.defs.get(taintId(taint))
+        if not lines:
+            return None
+        return self.line(lines[0])
+
+    def backwardSlice(self, taint):
+        """
+        Yields (line number, stripped line) for every line in the backward
+        slice of taint, last line first. Gives the same lines, in the same
+        order, as scanning reversed(f.readlines()) and following "tN="
+        definitions of every taint seen on a matched line.
+
+        :param taint: 't12', '12' or 12
+        """
+        heap = []
+        entered = set()
+
+        def enter(t, bound):
+            # t became relevant at line bound; its definitions above that
+            # line are now part of the slice.
+            entered.add(t)
+            for n in self.defs.get(t, ()):
+                if n < bound:
+                    heapq.heappush(heap, -n)
+
+        enter(taintId(taint), len(self))
+        last = None
+        while heap:
+            n = -heapq.heappop(heap)
+            if n == last:
+                continue
+            last = n
+            yield n, self.line(n).strip()
+            for t in self.lineTaints.get(n, ()):
+                if t not in entered:
+                    enter(t, n)
+
+    def reachesBlock(self, taint):
+        """
+        Returns True if the forward slice of taint (see forwardSlice) has a
+        B() line, i.e. if something derived from taint becomes a block size
+        or number. Answered from one byte per taint, computed for every taint
+        at once and saved with the index.
+        """
+        buf, base, count = self._blockReach()
+        t = taintId(taint)
+        return 0 <= t < count and buf[base + t:base + t + 1] == '\x01'
+
+    def _blockReach(self):
+        if self._reach is None:
+            flags = self._computeBlockReach()
+            self._reach = (flags, 0, len(flags))
+        return self._reach
+
+    def _computeBlockReach(self):
+        """
+        Propagates a "reaches a B() line" bit over the def-use graph, walking
+        the trace backwards so every line sees the final bits of the lines
+        after it. A line hits if it is a B() line or defines a taint whose
+        later uses hit; every taint it mentions then reaches a block. As in
+        forwardSlice, a taint is only followed into the uses after the line
+        that defines it, and the definition of the seed itself does not count.
+        """
+        ptr = toArray(self.lineTaints._ptr)
+        ids = toArray(self.lineTaints._lines)
+        defined = toArray(self.defined)
+        blocks = set(toArray(self.blocks))
+        size = max(ids) + 1 if len(ids) else 0
+        # after[t]: some line after a definition of t hits (followed taints)
+        # reach[t]: some line other than a definition of t hits (seeds)
+        after = bytearray(size)
+        reach = bytearray(size)
+        for n in xrange(len(self) - 1, -1, -1):
+            start, stop = ptr[n], ptr[n + 1]
+            if start == stop:
+                continue
+            d = defined[n]
+            if n in blocks or (d != NO_TAINT and after[d]):
+                for k in xrange(start, stop):
+                    t = ids[k]
+                    after[t] = 1
+                    if t != d:
+                        reach[t] = 1
+        return reach
+
+    def blockInputs(self):
+        """
+        Returns one byte per taint id, 1 for the taints a block is built
+        from: those mentioned by a B() line or stored into a block, and
+        transitively the operands of their definitions. The opposite
+        direction of reachesBlock, which follows the uses of a taint.
+        """
+        ptr = toArray(self.lineTaints._ptr)
+        ids = toArray(self.lineTaints._lines)
+        defined = toArray(self.defined)
+        blocks = set(toArray(self.blocks))
+        block_taints = set(defined[n] for n in blocks)
+        size = max(ids) + 1 if len(ids) else 0
+        inputs = bytearray(size)
+        # Definitions come before uses, so walking backwards every taint is
+        # marked before the line defining it is reached.
+        for n in xrange(len(self) - 1, -1, -1):
+            start, stop = ptr[n], ptr[n + 1]
+            if start == stop:
+                continue
+            d = defined[n]
+            if (n in blocks or (d != NO_TAINT and inputs[d]) or
+                    (self.kind(n) == STORE and ids[start] in block_taints)):
+                for k in xrange(start, stop):
+                    inputs[ids[k]] = 1
+        return inputs
+
+    def written(self, n):
+        """
+        Returns the taint line n defines or stores into ("tN[i]="), or
+        NO_TAINT.
+        """
+        t = self.defined[n]
+        if t == NO_TAINT and self.kind(n) == STORE:
+            return self.lineTaints.get(n)[0]
+        return t
+
+    def forwardSlice(self, taint):
+        """
+        Yields (line number, stripped line) for every line in the forward
+        slice of taint, in file order. Gives the same lines as scanning the
+        trace forward, skipping the definition of taint itself, and adding
+        the definitions of every matched line to the relevant set. Stores
+        ("tN[i]=") do not make their destination relevant; unlike
+        traceSlicer.bfs, which follows them, this is the slice the
+        classification helpers (reachesBlock, MultiSlice) are defined by.
+
+        :param taint: 't12', '12' or 12
+        """
+        taint = taintId(taint)
+        heap = list(self.uses.get(taint, ()))
+        heapq.heapify(heap)
+        entered = set([taint])
+        last = None
+        while heap:
+            n = heapq.heappop(heap)
+            if n == last:
+                continue
+            last = n
+            t = self.defined[n]
+            if t == taint:
+                continue
+            yield n, self.line(n).strip()
+            if t != NO_TAINT and t not in entered:
+                entered.add(t)
+                for m in self.uses.get(t, ()):
+                    if m > n:
+                        heapq.heappush(heap, m)
+
+
+def _shardBounds(trace_file, jobs):
+    """
+    Returns the byte offsets cutting trace_file into at most jobs ranges of
+    whole lines, starting with 0 and ending with the size of the file.
+    """
+    buf = mapTrace(trace_file)
+    size = len(buf)
+    jobs = max(1, min(jobs, size // MIN_SHARD_SIZE))
+    bounds = [0]
+    try:
+        for i in range(1, jobs):
+            cut = buf.find('\n', max(size * i // jobs, bounds[-1])) + 1
+            if cut <= bounds[-1] or cut >= size:
+                break
+            bounds.append(cut)
+    finally:
+        buf.close()
+    bounds.append(size)
+    return bounds
+
+
+def _countLines(args):
+    trace_file, start, stop = args
+    count = 0
+    with openTrace(trace_file) as f:
+        f.seek(start)
+        while start < stop:
+            chunk = f.read(min(FINGERPRINT_CHUNK, stop - start))
+            if not chunk:
+                break
+            count += chunk.count('\n')
+            start += len(chunk)
+    # Only the last shard can end without a newline, and its count is unused.
+    return count
+
+
+def _parseShard(args):
+    """
+    Indexes the lines of one byte range of a trace, numbering them from
+    first. Runs in a worker process of TraceIndex._buildSharded, and returns
+    the line tables as array strings, which are cheap to send back, and the
+    users map (see _userPairs).
+    """
+    trace_file, start, stop, first = args
+    index = TraceIndex.__new__(TraceIndex)
+    index.trace_file = trace_file
+    index._reset()
+    index.offsets = array.array(INT_TYPE)
+    heads = set()
+    with openTrace(trace_file) as f:
+        f.seek(start)
+        index._parse(f, start, first, True, stop, heads)
+    tables = {'kinds': str(index.kinds),
+              'lineTaints.ptr': index.lineTaints._ptr.tostring(),
+              'lineTaints.ids': index.lineTaints._lines.tostring(),
+              'users': _userPairs(index.users, heads)}
+    for name in ('offsets', 'defined', 'blocks', 'icmps'):
+        tables[name] = getattr(index, name).tostring()
+    return tables
+
+
+def _userPairs(users, heads):
+    """
+    Flattens the users map of a shard into its size (as in _csr) and the
+    strings of three arrays: the taint of every user, the users, and the
+    positions of the first user of the taints in heads (whose first user
+    comes from a store).
+    """
+    keys = array.array(INT_TYPE)
+    values = array.array(INT_TYPE)
+    firsts = array.array(INT_TYPE)
+    for taint, lines in users.iteritems():
+        if taint in heads:
+            firsts.append(len(values))
+        keys.extend(array.array(INT_TYPE, [taint]) * len(lines))
+        values.extend(lines)
+    size = max(users) + 1 if users else 0
+    return size, keys.tostring(), values.tostring(), firsts.tostring()
+
+
+def _joinArrays(buffers):
+    """
+    Returns the array of the concatenated array strings.
+    """
+    data = array.array(INT_TYPE)
+    for buf in buffers:
+        data.fromstring(buf)
+    return data
+
+
+def _joinCsr(shards):
+    """
+    Concatenates the (ptr, lines) strings of maps keyed by line number, one
+    per shard in file order, into one map.
+    """
+    ptr = array.array(INT_TYPE, [0])
+    lines = array.array(INT_TYPE)
+    for shard_ptr, shard_lines in shards:
+        shard_ptr = array.array(INT_TYPE, shard_ptr)
+        base = len(lines)
+        ptr.extend(p + base for p in shard_ptr[1:])
+        lines.fromstring(shard_lines)
+    return ptr, lines
+
+
+def _csrArrays(keys, values, size=None):
+    """
+    Returns the (ptr, lines) arrays (see _csr) of the map from every key to
+    its values, in the order they are given. keys and values are NumPy
+    arrays of the same length; size defaults to the largest key plus one.
+    """
+    import numpy as np
+
+    dtype = np.dtype(INT_TYPE)
+    # Stable, so the values of a key stay in order.
+    order = np.argsort(keys, kind='mergesort')
+    if size is None:
+        size = int(keys.max()) + 1 if len(keys) else 0
+    ptr = np.zeros(size + 1, dtype)
+    np.cumsum(np.bincount(keys, minlength=size), out=ptr[1:])
+    return array.array(INT_TYPE, ptr.tostring()), array.array(INT_TYPE, values[order].tostring())
+
+
+def _mergeUsers(shards):
+    """
+    Merges the _userPairs of every shard, in file order, into the (ptr,
+    lines) arrays of users. The first user of a head taint is dropped when
+    it repeats the last user of the taint in the shards before: the store
+    continues a run, which _parse would have recorded once.
+    """
+    import numpy as np
+
+    dtype = np.dtype(INT_TYPE)
+    keys, values, heads = [], [], []
+    base = size = 0
+    for shard_size, shard_keys, shard_values, shard_heads in shards:
+        size = max(size, shard_size)
+        keys.append(np.frombuffer(shard_keys, dtype))
+        values.append(np.frombuffer(shard_values, dtype))
+        heads.append(np.frombuffer(shard_heads, dtype) + base)
+        base += len(keys[-1])
+    key = np.concatenate(keys)
+    value = np.concatenate(values)
+    head = np.zeros(len(key), dtype=bool)
+    head[np.concatenate(heads)] = True
+    order = np.argsort(key, kind='mergesort')
+    key, value, head = key[order], value[order], head[order]
+    repeated = np.zeros(len(key), dtype=bool)
+    repeated[1:] = head[1:] & (key[1:] == key[:-1]) & (value[1:] == value[:-1])
+    return _csrArrays(key[~repeated], value[~repeated], size)
+
+
+_indexes = {}
+
+
+def getTraceIndex(trace_file, jobs=None):
+    """
+    Returns the TraceIndex of trace_file, loading it from the on-disk cache or
+    parsing the trace on first use. jobs is the number of processes parsing
+    the trace, by default $FSLICE_JOBS or 1.
+    """
+    index = _indexes.get(trace_file)
+    if index is None:
+        if jobs is None:
+            jobs = int(os.environ.get('FSLICE_JOBS', 1))
+        index = _indexes[trace_file] = TraceIndex.load(trace_file, jobs=jobs)
+    return index
@@ -0,0 +1,119 @@
+#!/usr/bin/python
+"""
+Client of traceServer.py: sends one query and prints the answer.
+
+    python traceQuery.py [--trace FILE] [--socket PATH] COMMAND [ARGS...]
+
+If no server is listening on the socket of the trace (<trace>.sock), one is
+started in the background and the query waits for it to load the trace.
+Exits with status 1 if the server answered with an error.
+"""
+
+import errno
+import os
+import socket
+import sys
+import time
+
+DEFAULT_TRACE = "/tmp/testfs.py"
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'traceServer.py')
+POLL_INTERVAL = 0.05
+
+
+def usage():
+    sys.stderr.write("usage: {} [--trace FILE] [--socket PATH] COMMAND [ARGS...]\n".format(sys.argv[0]))
+    sys.exit(2)
+
+
+def connect(socket_file):
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(socket_file)
+    except socket.error:
+        s.close()
+        raise
+    return s
+
+
+def startServer(trace_file, socket_file):
+    """
+    Starts traceServer.py in the background and returns a connection to it
+    once it listens.
+    """
+    # Imported here: most queries find the server running, and the import
+    # costs more than the query.
+    import subprocess
+    with open(os.devnull, 'r+') as devnull:
+        server = subprocess.Popen([sys.executable, SERVER, trace_file, '--socket', socket_file],
+                                  stdin=devnull, stdout=devnull, stderr=devnull,
+                                  preexec_fn=os.setsid)
+    while True:
+        try:
+            return connect(socket_file)
+        except socket.error as e:
+            if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+                raise
+        if server.poll() is not None:
+            sys.stderr.write("traceQuery: the server for {} exited\n".format(trace_file))
+            sys.exit(1)
+        time.sleep(POLL_INTERVAL)
+
+
+def query(trace_file, socket_file, words, out=sys.stdout):
+    """
+    Sends one query and copies the answer to out. Returns False if the
+    server answered with an error.
+    """
+    try:
+        s = connect(socket_file)
+    except socket.error as e:
+        if e.errno not in (errno.ENOENT, errno.ECONNREFUSED):
+            raise
+        s = startServer(trace_file, socket_file)
+    try:
+        s.sendall(' '.join(words) + '\n')
+        s.shutdown(socket.SHUT_WR)
+        first = True
+        ok = True
+        while True:
+            data = s.recv(1 << 16)
+            if not data:
+                break
+            if first and data.startswith('ERROR:'):
+                ok = False
+                out = sys.stderr
+            first = False
+            out.write(data)
+        return ok
+    finally:
+        s.close()
+
+
+def main():
+    args = sys.argv[1:]
+    trace_file = DEFAULT_TRACE
+    socket_file = None
+    while args and args[0] in ('--trace', '--socket'):
+        if len(args) < 2:
+            usage()
+        if args[0] == '--trace':
+            trace_file = args[1]
+        else:
+            socket_file = args[1]
+        args = args[2:]
+    if not args:
+        usage()
+    if socket_file is None:
+        socket_file = os.path.abspath(trace_file) + '.sock'
+    try:
+        ok = query(trace_file, socket_file, args)
+    except IOError as e:
+        if e.errno != errno.EPIPE:
+            raise
+        # The output was closed early, e.g. traceQuery.py ... | head.
+        ok = True
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+"""
+Memory-mapped access to the lines of a taint trace.
+
+TraceReader maps the trace once and uses a line-offset table (the offsets
+kept by TraceIndex, which are themselves memory-mapped from <trace>.idx) to
+return any line by number. Walking the trace backwards is then a matter of
+slicing the map from the last offset to the first, so backward slices start
+at once and never hold more than the current line in memory, unlike
+reversed(f.readlines()). Compressed traces are read through their frame index
+(see compressedTrace).
+"""
+
+from compressedTrace import mapTrace
+
+
+class TraceReader(object):
+
+    def __init__(self, trace_file, offsets):
+        """
+        :param offsets: byte offset of every line of trace_file, followed by
+                        the size of the file (TraceIndex.offsets)
+        """
+        self.trace_file = trace_file
+        self.offsets = offsets
+        # An mmap of the trace, or a CompressedTrace that decompresses the
+        # frames holding the lines asked for.
+        self.buf = mapTrace(trace_file)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def line(self, n):
+        """
+        Returns line n of the trace, including its trailing newline.
+        """
+        return self.buf[self.offsets[n]:self.offsets[n + 1]]
+
+    def lines(self, start=0, stop=None):
+        """
+        Yields (line number, line) for lines start..stop-1, in file order.
+        """
+        if stop is None:
+            stop = len(self)
+        buf = self.buf
+        begin = self.offsets[start]
+        for n in xrange(start, stop):
+            end = buf.find('\n', begin) + 1 or len(buf)
+            yield n, buf[begin:end]
+            begin = end
+
+    def reversedLines(self, stop=None):
+        """
+        Yields (line number, line) for lines stop-1 down to 0.
+        """
+        if stop is None:
+            stop = len(self)
+        # Sequential walks find line starts with rfind instead of going
+        # through the offset table line by line.
+        buf = self.buf
+        end = self.offsets[stop]
+        for n in xrange(stop - 1, -1, -1):
+            begin = buf.rfind('\n', 0, end - 1) + 1
+            yield n, buf[begin:end]
+            end = begin
+
+    def close(self):
+        if not isinstance(self.buf, str):
+            self.buf.close()
@@ -0,0 +1,224 @@
+#!/usr/bin/python
+"""
+Long-lived query server over one taint trace.
+
+The shell scripts used to grep the whole trace once per taint or per block.
+traceServer.py loads the TraceIndex of a trace once and answers queries on a
+Unix socket (<trace>.sock by default), so each of those greps becomes one
+round trip. Use traceQuery.py as the client; it starts the server on first
+use:
+
+    python traceQuery.py --trace /tmp/testfs.py def t42
+
+A query is one line, "COMMAND ARGS...". The server answers with the lines of
+the result and closes the connection; errors are a single "ERROR: ..." line.
+
+    def T            definitions of T ("tN=" lines)
+    uses T           lines mentioning T
+    block T          block number of the B() record defining T
+    blocks           every B() line
+    icmps            every ICMP line
+    reaches T        1 if something derived from T becomes a block, else 0
+    slice [-b] [-d N] [--max-nodes N] T
+                     the slice printed by trace.py
+    backward T       TraceIndex.backwardSlice of T (cached, see sliceCache)
+    forward T        TraceIndex.forwardSlice of T (cached)
+    backtrace T      backward slice of T with the ICMP lines before it
+    grep TEXT        lines containing TEXT (the rest of the query line)
+    stats            slice cache counters
+    shutdown         stop the server
+
+The server exits after --idle seconds without a query (default: 600).
+"""
+
+import argparse
+import getopt
+import errno
+import os
+import socket
+import SocketServer
+import sys
+
+from getIntermediateICMPs import relevantLines
+from sliceCache import getSliceCache
+from traceIndex import getTraceIndex, taintId
+from traceSlicer import BACKWARD, FORWARD, bfs
+from traceTokenizer import tokenize
+
+SOCKET_SUFFIX = '.sock'
+
+
+def socketPath(trace_file):
+    return os.path.abspath(trace_file) + SOCKET_SUFFIX
+
+
+class QueryError(Exception):
+    pass
+
+
+def _taint(args):
+    if len(args) != 1:
+        raise QueryError("expected one taint")
+    try:
+        return taintId(args[0])
+    except ValueError:
+        raise QueryError("not a taint: {}".format(args[0]))
+
+
+class TraceQueries(object):
+    """
+    The commands of the server, each a generator of result lines.
+    """
+
+    def __init__(self, trace_file, jobs=None):
+        self.trace_file = trace_file
+        self.index = getTraceIndex(trace_file, jobs)
+        self.slices = getSliceCache(trace_file)
+
+    def run(self, query):
+        command, _, rest = query.strip().partition(' ')
+        method = getattr(self, 'cmd_' + command, None)
+        if not command or method is None:
+            raise QueryError("unknown command: {}".format(command))
+        return method(rest.split(), rest)
+
+    def _lines(self, numbers):
+        for n in numbers:
+            yield self.index.line(n).strip()
+
+    def cmd_def(self, args, rest):
+        return self._lines(self.index.defs.get(_taint(args), ()))
+
+    def cmd_uses(self, args, rest):
+        return self._lines(self.index.uses.get(_taint(args), ()))
+
+    def cmd_block(self, args, rest):
+        for line in self.cmd_def(args, rest):
+            record = tokenize(line)
+            if record.kind == 'B':
+                # B(size, nr, tSize, tNr, id)
+                yield str(record.literals[1])
+
+    def cmd_blocks(self, args, rest):
+        return self._lines(self.index.blocks)
+
+    def cmd_icmps(self, args, rest):
+        return self._lines(self.index.icmps)
+
+    def cmd_reaches(self, args, rest):
+        yield '1' if self.index.reachesBlock(_taint(args)) else '0'
+
+    def cmd_slice(self, args, rest):
+        try:
+            opts, args = getopt.getopt(args, 'bd:', ['max-nodes='])
+            opts = dict(opts)
+            depth = int(opts['-d']) if '-d' in opts else None
+            max_nodes = int(opts['--max-nodes']) if '--max-nodes' in opts else None
+        except (getopt.GetoptError, ValueError) as e:
+            raise QueryError(str(e))
+        direction = BACKWARD if '-b' in opts else FORWARD
+        result = bfs(self.index, _taint(args), direction, depth, max_nodes)
+        return (line for _, line in result.lines(self.index))
+
+    def cmd_backward(self, args, rest):
+        return (line for _, line in self.slices.lines(_taint(args), BACKWARD))
+
+    def cmd_forward(self, args, rest):
+        return (line for _, line in self.slices.lines(_taint(args), FORWARD))
+
+    def cmd_backtrace(self, args, rest):
+        return (line.strip() for line in relevantLines(self.index, 't{}'.format(_taint(args))))
+
+    def cmd_grep(self, args, rest):
+        if not rest:
+            raise QueryError("expected text to search for")
+        buf = self.index.reader.buf
+        end = -1
+        found = buf.find(rest)
+        while found != -1:
+            if found >= end:
+                begin = buf.rfind('\n', 0, found) + 1
+                end = buf.find('\n', found)
+                if end == -1:
+                    end = len(buf)
+                yield buf[begin:end].strip()
+            found = buf.find(rest, max(found + 1, end))
+
+    def cmd_stats(self, args, rest):
+        yield "{} lines, {} blocks, {} ICMPs".format(len(self.index), len(self.index.blocks),
+                                                    len(self.index.icmps))
+        yield "slice cache: {}".format(self.slices.stats())
+
+    def cmd_shutdown(self, args, rest):
+        raise SystemExit(0)
+
+
+class QueryHandler(SocketServer.StreamRequestHandler):
+
+    def handle(self):
+        query = self.rfile.readline()
+        try:
+            for line in self.server.queries.run(query):
+                self.wfile.write(line)
+                self.wfile.write('\n')
+        except QueryError as e:
+            self.wfile.write("ERROR: {}\n".format(e))
+        except SystemExit:
+            self.server.done = True
+        except Exception as e:
+            self.wfile.write("ERROR: {}: {}\n".format(type(e).__name__, e))
+
+
+class TraceServer(SocketServer.UnixStreamServer):
+    """
+    Serves the queries of one trace, one connection at a time.
+    """
+
+    def __init__(self, socket_file, queries, idle):
+        self.queries = queries
+        self.done = False
+        self.timeout = idle
+        if os.path.exists(socket_file):
+            # Left over by a server that did not exit cleanly.
+            os.remove(socket_file)
+        self.socket_file = socket_file
+        SocketServer.UnixStreamServer.__init__(self, socket_file, QueryHandler)
+
+    def handle_timeout(self):
+        self.done = True
+
+    def handle_error(self, request, client_address):
+        error = sys.exc_info()[1]
+        if isinstance(error, socket.error) and error.errno in (errno.EPIPE, errno.ECONNRESET):
+            # The client stopped reading, e.g. traceQuery.py ... | head.
+            return
+        SocketServer.UnixStreamServer.handle_error(self, request, client_address)
+
+    def serve(self):
+        try:
+            while not self.done:
+                self.handle_request()
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_file):
+                os.remove(self.socket_file)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve queries over a taint trace on a Unix socket.")
+    parser.add_argument('trace', help="trace file, e.g. /tmp/testfs.py")
+    parser.add_argument('--socket', help="socket path (default: <trace>.sock)")
+    parser.add_argument('--idle', type=float, default=600.0,
+                        help="exit after this many seconds without a query (default: 600)")
+    parser.add_argument('--jobs', type=int, default=None,
+                        help="parse the trace in this many processes (default: $FSLICE_JOBS or 1)")
+    args = parser.parse_args()
+
+    queries = TraceQueries(args.trace, args.jobs)
+    server = TraceServer(args.socket or socketPath(args.trace), queries, args.idle)
+    sys.stderr.write("serving {} on {}\n".format(args.trace, server.socket_file))
+    server.serve()
+
+
+if __name__ == '__main__':
+    main()
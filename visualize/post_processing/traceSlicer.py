@@ -0,0 +1,405 @@
+"""
+Breadth-first slicing over the def-use graph of a trace.
+
+TraceIndex keeps the graph in compressed sparse row form: deps maps a taint
+to the operands of its definition, uses maps it to the lines mentioning it.
+A slice is a BFS over taints, so its cost depends on the size of the slice
+and not on the size of the trace, and its depth is the number of hops from
+the seed taint.
+
+    backward  the definitions of the seed and, transitively, of its operands
+    forward   the lines that read the seed and, transitively, the lines that
+              read the taints those lines define or store into, after the
+              line that did
+
+With a depth of d, a slice has the lines of d hops: a backward slice of
+depth 1 is the definition of the seed, a forward slice of depth 1 is the
+lines that use it.
+
+SliceStream yields the lines of one slice as SliceRecords (line number, taint,
+kind, operands, ...) while they are read, for callers that consume a slice
+lazily instead of parsing the text trace.py prints.
+
+The forward slice of bfs follows stores: tD[i]=tS makes tD relevant after
+that line. TraceIndex.forwardSlice and reachesBlock, which decide whether a
+block is typed, do not.
+
+MultiSlice computes the slices of many seeds at once, with the semantics of
+TraceIndex.forwardSlice and backwardSlice: one pass per BATCH_SIZE seeds,
+each taint carrying the set of seeds that reached it.
+"""
+
+import bisect
+import heapq
+from collections import namedtuple
+
+from traceIndex import taintId, toArray
+from traceTokenizer import NO_TAINT, STORE, tokenize
+
+BACKWARD = 'backward'
+FORWARD = 'forward'
+
+# line      line number in the trace
+# taint     taint id defined by the line, or NO_TAINT
+# kind      record kind (see traceTokenizer)
+# operands  taint ids referenced by the line, in order
+# literals  integer and string arguments, in order
+# text      the line, stripped
+SliceRecord = namedtuple('SliceRecord', ['line', 'taint', 'kind', 'operands', 'literals', 'text'])
+
+
+def sliceRecord(index, n):
+    """
+    Returns the SliceRecord of line n.
+    """
+    text = index.line(n).strip()
+    record = tokenize(text)
+    return SliceRecord(n, record.defined, record.kind, record.operands, record.literals, text)
+
+
+class Slice(object):
+    """
+    Result of a BFS: the taints reached and the hop at which each was first
+    reached. truncated is True when the BFS stopped at max_nodes.
+    """
+
+    def __init__(self, taint, direction, depth, hops, truncated, entries=None):
+        self.taint = taint
+        self.direction = direction
+        self.depth = depth
+        self.hops = hops
+        self.truncated = truncated
+        # Forward: taint => line from which its reads are in the slice.
+        self.entries = entries
+
+    def __len__(self):
+        return len(self.hops)
+
+    def __contains__(self, taint):
+        return taint in self.hops
+
+    def taints(self):
+        return self.hops.keys()
+
+    def lineNumbers(self, index):
+        """
+        Returns the line numbers of the slice, in the order trace.py prints
+        them: last line first for a backward slice, file order otherwise.
+        """
+        lines = set()
+        for taint, hop in self.hops.iteritems():
+            if self.depth and hop >= self.depth:
+                continue
+            if self.direction == BACKWARD:
+                lines.update(index.defs.get(taint, ()))
+            else:
+                lines.update(usingLines(index, taint, self.entries[taint]))
+        return sorted(lines, reverse=self.direction == BACKWARD)
+
+    def lines(self, index):
+        """
+        Yields (line number, stripped line) for every line of the slice.
+        """
+        for n in self.lineNumbers(index):
+            yield n, index.line(n).strip()
+
+    def records(self, index):
+        """
+        Yields the SliceRecord of every line of the slice.
+        """
+        for n in self.lineNumbers(index):
+            yield sliceRecord(index, n)
+
+
+def usingLines(index, taint, after=-1):
+    """
+    Yields the lines after line after that read taint: every line
+    mentioning it, except its own definitions and stores into it.
+    """
+    uses = index.uses.get(taint, ())
+    for n in uses[bisect.bisect_right(uses, after):] if after >= 0 else uses:
+        if index.written(n) != taint:
+            yield n
+
+
+class _Walk(object):
+    """
+    Iterates over (taint, hop) in the order a BFS reaches the taints.
+    truncated is set when the walk stops at max_nodes.
+
+    Forward, a taint is reached by a line of the slice that defines it or
+    stores into it, and only its reads after that line are followed; entries
+    keeps the earliest such line. A taint reached again by an earlier line
+    is yielded again, with its first hop, to follow the reads in between.
+    """
+
+    def __init__(self, index, taint, direction, depth, max_nodes):
+        self.index = index
+        self.taint = taint
+        self.direction = direction
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.hops = {}
+        self.entries = None if direction == BACKWARD else {}
+        self.truncated = False
+
+    def _next(self, current):
+        # (taint, line) for every taint reached from current, in file order.
+        if self.direction == BACKWARD:
+            for t in self.index.deps.get(current, ()):
+                yield t, None
+            return
+        for n in usingLines(self.index, current, self.entries[current]):
+            t = self.index.written(n)
+            if t != NO_TAINT:
+                yield t, n
+
+    def __iter__(self):
+        depth = self.depth
+        max_nodes = self.max_nodes
+        hops = self.hops
+        entries = self.entries
+        hops[self.taint] = 0
+        if entries is not None:
+            entries[self.taint] = -1
+        yield self.taint, 0
+        frontier = [self.taint]
+        hop = 0
+        while frontier and (not depth or hop < depth):
+            hop += 1
+            next_frontier = []
+            for current in frontier:
+                for t, n in self._next(current):
+                    if t in hops:
+                        if entries is not None and n < entries[t]:
+                            entries[t] = n
+                            next_frontier.append(t)
+                            yield t, hops[t]
+                        continue
+                    if max_nodes and len(hops) >= max_nodes:
+                        self.truncated = True
+                        return
+                    hops[t] = hop
+                    if entries is not None:
+                        entries[t] = n
+                    next_frontier.append(t)
+                    yield t, hop
+            frontier = next_frontier
+
+
+def bfs(index, taint, direction=BACKWARD, depth=None, max_nodes=None):
+    """
+    Returns the Slice of taint.
+
+    :param direction: BACKWARD or FORWARD
+    :param depth: maximum number of hops, or None (or 0) for no limit
+    :param max_nodes: maximum number of taints to visit, or None
+    """
+    taint = taintId(taint)
+    walk = _Walk(index, taint, direction, depth, max_nodes)
+    for _ in walk:
+        pass
+    return Slice(taint, direction, depth, walk.hops, walk.truncated, walk.entries)
+
+
+class SliceStream(object):
+    """
+    The lines of the slice of taint (the lines of bfs with the same
+    arguments), as SliceRecords produced while iterating: each line is read
+    and tokenized only when it is yielded, and none is kept.
+
+    In trace order (ordered=True, the order of trace.py) the BFS over taint
+    ids has to finish before the first line. With ordered=False the lines of
+    a taint are yielded as soon as the BFS reaches it, nearest hops first.
+    truncated is set once iteration stops at max_nodes.
+    """
+
+    def __init__(self, index, taint, direction=BACKWARD, depth=None, max_nodes=None, ordered=True):
+        self.index = index
+        self.taint = taintId(taint)
+        self.direction = direction
+        self.depth = depth
+        self.max_nodes = max_nodes
+        self.ordered = ordered
+        self.truncated = False
+
+    def __iter__(self):
+        index = self.index
+        if self.ordered:
+            result = bfs(index, self.taint, self.direction, self.depth, self.max_nodes)
+            self.truncated = result.truncated
+            for record in result.records(index):
+                yield record
+            return
+
+        walk = _Walk(index, self.taint, self.direction, self.depth, self.max_nodes)
+        seen = set()
+        for taint, hop in walk:
+            if self.depth and hop >= self.depth:
+                continue
+            if self.direction == BACKWARD:
+                lines = index.defs.get(taint, ())
+            else:
+                lines = usingLines(index, taint, walk.entries[taint])
+            for n in lines:
+                if n not in seen:
+                    seen.add(n)
+                    yield sliceRecord(index, n)
+        self.truncated = walk.truncated
+
+
+# Seeds per MultiSlice pass. Every taint reached carries an integer bitset
+# of up to this many bits.
+BATCH_SIZE = 4096
+
+
+def _bits(mask):
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+
+class MultiSlice(object):
+    """
+    The slices of many seeds, computed together by label propagation: a pass
+    visits the lines of the union of the slices once (in file order forward,
+    last line first backward) and every taint carries a bitset of the seeds
+    whose slice reached it, so thousands of seeds cost a handful of passes
+    instead of one slice each.
+    Every seed gets the same lines, in the same order, as
+    TraceIndex.forwardSlice or backwardSlice.
+    """
+
+    def __init__(self, index, seeds, direction=FORWARD):
+        """
+        :param seeds: taints as accepted by taintId
+        :param direction: BACKWARD or FORWARD
+        """
+        self.index = index
+        self.seeds = sorted(set(taintId(seed) for seed in seeds))
+        self.direction = direction
+        self._dropped = set()
+        # seeds dropped since the running pass last looked
+        self._pending = []
+        self._ptr = toArray(index.lineTaints._ptr)
+        self._ids = toArray(index.lineTaints._lines)
+        self._defined = toArray(index.defined)
+
+    def drop(self, seed):
+        """
+        Stops following seed: its slice is not needed any further.
+        """
+        seed = taintId(seed)
+        if seed not in self._dropped:
+            self._dropped.add(seed)
+            self._pending.append(seed)
+
+    def lines(self, wanted=None):
+        """
+        Yields (line number, seeds) for every line in the slice of any seed,
+        where seeds lists the seeds whose slice has the line. Only the lines
+        n for which wanted(n) is true are yielded.
+        """
+        for start in range(0, len(self.seeds), BATCH_SIZE):
+            batch = [seed for seed in self.seeds[start:start + BATCH_SIZE]
+                     if seed not in self._dropped]
+            if not batch:
+                continue
+            if self.direction == BACKWARD:
+                passLines = self._backward(batch, wanted)
+            else:
+                passLines = self._forward(batch, wanted)
+            for n, seeds in passLines:
+                yield n, seeds
+
+    def _active(self, batch, active=None):
+        """
+        Returns the bitset of the seeds of batch still followed, given the
+        previous one.
+        """
+        if active is None:
+            active = (1 << len(batch)) - 1
+        for seed in self._pending:
+            i = bisect.bisect_left(batch, seed)
+            if i < len(batch) and batch[i] == seed:
+                active &= ~(1 << i)
+        del self._pending[:]
+        return active
+
+    def _forward(self, batch, wanted):
+        index, ptr, ids, defined = self.index, self._ptr, self._ids, self._defined
+        labels = dict((seed, 1 << i) for i, seed in enumerate(batch))
+        # The line defining a seed is not part of its own slice.
+        own = dict(labels)
+        # Only the lines using a labelled taint are visited, in file order.
+        heap = []
+        for seed in batch:
+            heap.extend(index.uses.get(seed, ()))
+        heapq.heapify(heap)
+        active = self._active(batch)
+        last = None
+        while heap:
+            n = heapq.heappop(heap)
+            if n == last:
+                continue
+            last = n
+            mask = 0
+            for k in xrange(ptr[n], ptr[n + 1]):
+                label = labels.get(ids[k])
+                if label:
+                    mask |= label
+            t = defined[n]
+            if t != NO_TAINT:
+                mask &= ~own.get(t, 0)
+            mask &= active
+            if not mask:
+                continue
+            if t != NO_TAINT:
+                label = labels.get(t, 0)
+                if not label:
+                    for m in index.uses.get(t, ()):
+                        if m > n:
+                            heapq.heappush(heap, m)
+                labels[t] = label | mask
+            if wanted is None or wanted(n):
+                yield n, [batch[i] for i in _bits(mask)]
+                if self._pending:
+                    active = self._active(batch, active)
+                    if not active:
+                        return
+
+    def _backward(self, batch, wanted):
+        index, ptr, ids, defined = self.index, self._ptr, self._ids, self._defined
+        labels = dict((seed, 1 << i) for i, seed in enumerate(batch))
+        # Only the definitions of labelled taints are visited, last first.
+        heap = []
+        for seed in batch:
+            heap.extend(-n for n in index.defs.get(seed, ()))
+        heapq.heapify(heap)
+        active = self._active(batch)
+        last = None
+        while heap:
+            n = -heapq.heappop(heap)
+            if n == last:
+                continue
+            last = n
+            mask = labels.get(defined[n], 0) & active
+            if not mask:
+                continue
+            if wanted is None or wanted(n):
+                yield n, [batch[i] for i in _bits(mask)]
+                if self._pending:
+                    active = self._active(batch, active)
+                    mask &= active
+                    if not active:
+                        return
+            # Every taint on the line is now relevant above it.
+            for k in xrange(ptr[n], ptr[n + 1]):
+                u = ids[k]
+                label = labels.get(u, 0)
+                if not label:
+                    for m in index.defs.get(u, ()):
+                        if m < n:
+                            heapq.heappush(heap, -m)
+                labels[u] = label | mask
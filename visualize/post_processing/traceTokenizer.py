@@ -0,0 +1,153 @@
+"""
+Tokenizer for taint trace records.
+
+Every line of a trace is one of
+
+    tN=F(arg, ...) [# comment]     definition (V, A, O, B, M, N, D, S, ...)
+    tN[i]=tM[k] [# comment]        store into byte i of tN
+    ICMP(tX,tY,'PRED')             comparison (or "ICMPBlock taint block pred")
+    # comment                      function names, #gBlockTAINT, ...
+
+tokenize() turns a line into a Record. TraceIndex tokenizes every line once
+when it is built and keeps the defined taint and the taints of every line in
+its cache, so the slicers work on integers instead of running
+re.findall(r"t[0-9]+", line) over every line of every query.
+"""
+
+from collections import namedtuple
+
+# Record kinds, one byte per line. Definitions use the constructor letter
+# that follows "tN=" (V, A, O, B, M, N, D, S).
+COMMENT = '#'
+ICMP = 'I'
+STORE = 's'
+OTHER = '?'
+
+# Value of Record.defined for lines that do not define a taint.
+NO_TAINT = -1
+
+# defined   taint id defined by "tN=", or NO_TAINT
+# kind      one of the kinds above
+# operands  taint ids referenced by the record, in order; for a store, the
+#           destination comes first
+# literals  integer and string arguments, in order; for a store, the
+#           destination byte and the source byte (when given)
+# comment   text after '#', stripped
+Record = namedtuple('Record', ['defined', 'kind', 'operands', 'literals', 'comment'])
+
+def scanTaints(text):
+    """
+    Returns the ids of every "tN" in text, like re.findall(r"t([0-9]+)").
+    """
+    taints = []
+    start = text.find('t')
+    while start != -1:
+        end = start + 1
+        while end < len(text) and text[end].isdigit():
+            end += 1
+        if end > start + 1:
+            taints.append(int(text[start + 1:end]))
+        start = text.find('t', end)
+    return taints
+
+
+def _arguments(text, operands, literals):
+    for token in text.split(','):
+        token = token.strip()
+        first = token[:1]
+        if first == 't':
+            if token[1:].isdigit():
+                operands.append(int(token[1:]))
+                continue
+            bracket = token.find('[')
+            if bracket > 1 and token[1:bracket].isdigit() and token[-1] == ']' \
+                    and token[bracket + 1:-1].isdigit():
+                # tN[k]: byte k of tN
+                operands.append(int(token[1:bracket]))
+                continue
+        elif token.isdigit():
+            literals.append(int(token))
+            continue
+        elif first == '-' and token[1:].isdigit():
+            literals.append(int(token))
+            continue
+        elif (first == '"' or first == "'") and len(token) > 1 and token[-1] == first:
+            literals.append(token[1:-1])
+            continue
+        _other(token, operands, literals)
+
+
+def _other(token, operands, literals):
+    # Anything else ("ICMPBlock 10 185 11", nested expressions): take the
+    # numbers as literals and pick up any taints mentioned in it.
+    for word in token.split():
+        if word.isdigit():
+            literals.append(int(word))
+        else:
+            operands.extend(scanTaints(word))
+
+
+def tokenize(line):
+    """
+    Returns the Record of a raw trace line.
+    """
+    if line[:1] == '#':
+        return Record(NO_TAINT, COMMENT, (), (), line[1:].strip())
+
+    code, _, comment = line.partition('#')
+    code = code.strip()
+    if not code:
+        return Record(NO_TAINT, OTHER, (), (), comment.strip())
+    defined = NO_TAINT
+    kind = OTHER
+    operands = []
+    literals = []
+    rest = code
+
+    equal = code.find('=')
+    if code[0] == 't' and equal > 1:
+        target = code[1:equal]
+        if target.isdigit():
+            defined = int(target)
+            rest = code[equal + 1:]
+            kind = rest[:1] or OTHER
+        else:
+            bracket = target.find('[')
+            if bracket > 0 and target[:bracket].isdigit() and target[-1] == ']' \
+                    and target[bracket + 1:-1].isdigit():
+                operands.append(int(target[:bracket]))
+                literals.append(int(target[bracket + 1:-1]))
+                rest = code[equal + 1:]
+                kind = STORE
+    if 'ICMP' in line:
+        kind = ICMP
+
+    paren = rest.find('(')
+    if paren != -1 and rest[-1] == ')':
+        name = rest[:paren]
+        if not name.isalpha():
+            operands.extend(scanTaints(name))
+        _arguments(rest[paren + 1:-1], operands, literals)
+    elif kind == STORE:
+        # tN[i]=tM or tN[i]=tM[k]
+        rest = rest.strip()
+        bracket = rest.find('[')
+        if rest[:1] == 't' and bracket > 1 and rest[1:bracket].isdigit() and rest[-1] == ']' \
+                and rest[bracket + 1:-1].isdigit():
+            operands.append(int(rest[1:bracket]))
+            literals.append(int(rest[bracket + 1:-1]))
+        else:
+            _arguments(rest, operands, literals)
+    else:
+        _arguments(rest, operands, literals)
+
+    return Record(defined, kind, tuple(operands), tuple(literals), comment.strip())
+
+
+def taints(record):
+    """
+    Returns every taint id of a record, the defined one first.
+    """
+    if record.defined == NO_TAINT:
+        return record.operands
+    return (record.defined,) + record.operands
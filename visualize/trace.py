@@ -1,5 +1,24 @@
 import argparse
-import re
+import json
+import os
+import sys
+
+# traceIndex lives in post_processing/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'post_processing'))
+from traceIndex import getTraceIndex
+from traceSlicer import BACKWARD, FORWARD, SliceStream
+from traceTokenizer import NO_TAINT
+
+
+def recordJson(record):
+    """
+    Returns a SliceRecord as one line of JSON.
+    """
+    fields = record._asdict()
+    if record.taint == NO_TAINT:
+        fields['taint'] = None
+    return json.dumps(fields)
+
 
 if __name__ == "__main__":
     """ Main Start """
@@ -7,63 +26,25 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('taint_val', type=str, help="TaintID to trace: ex. 1234")
     parser.add_argument('trace_file', type=str, help="The path to the trace file.")
-    parser.add_argument('-d', type=int, help='The maximum depth (optional)')
+    parser.add_argument('-d', type=int, help='The maximum depth in hops (optional)')
     parser.add_argument('-b', action='store_true')
+    parser.add_argument('--max-nodes', type=int, dest='max_nodes',
+                        help='Stop after visiting this many taints (optional)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Parse the trace in this many processes (default: $FSLICE_JOBS or 1)')
+    parser.add_argument('--json', action='store_true',
+                        help='Print one JSON object per line: line, taint, kind, operands, literals, text')
+    parser.add_argument('--bfs-order', action='store_true', dest='bfs_order',
+                        help='Print lines as the search reaches them instead of in trace order')
     args = parser.parse_args()
 
-    with open(args.trace_file, 'r') as f:
-
-        current_depth = 0
-        taint_str = None
-        input_lines = None
-        relevant_lines = []
-        printFunctionNames = None
-        # printFunctionNames = True
-
-        if args.b:
-            # Backward pass
-            taint_str = 't' + args.taint_val + '='
-            input_lines = reversed(f.readlines())
-        else:
-            # Forward pass
-            taint_str = 't' + args.taint_val
-            input_lines = f.readlines()
-
-        relevant = set([taint_str])
-        for line in input_lines:
-            if line[0] == '#' and not printFunctionNames:
-                continue
-
-            # Match
-            line = line.strip()
-            if args.b:
-                curset = set(re.findall(r"t[0-9]+=", line))
-            else:
-                curset = set(re.findall(r"t[0-9]+", line))
-
-            if len(curset) and relevant.intersection(curset):
-                cur = re.findall(r"t[0-9]+", line)
-                sol = []
-
-                for taint in cur:
-                    if args.b:
-                        sol.append(taint + '=')
-                    else:
-                        sol.append(taint)
-
-                relevant |= set(sol)
-                relevant_lines.append(line)
-
-                # Increase the current depth.
-                current_depth += 1
-
-            if printFunctionNames:
-                if line.endswith("()"):
-                    relevant_lines.append(line)
+    index = getTraceIndex(args.trace_file, args.jobs)
+    direction = BACKWARD if args.b else FORWARD
+    result = SliceStream(index, args.taint_val, direction, args.d, args.max_nodes,
+                         ordered=not args.bfs_order)
 
-            # Check if the maximum depth is reached.
-            if args.d and current_depth > args.d:
-                break
+    for record in result:
+        print(recordJson(record) if args.json else record.text)
 
-        for line in relevant_lines:
-            print(line)
+    if result.truncated:
+        sys.stderr.write("[WARN]: Slice truncated at {} taints.\n".format(args.max_nodes))